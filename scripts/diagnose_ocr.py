@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 
+import asyncio
 import base64
 from io import BytesIO
 from pathlib import Path
-from typing import List
+from typing import Awaitable, List
 
 import httpx
 import fitz
@@ -13,6 +14,35 @@ PDF_PATH = Path("uploads/藤和シティホームズ板橋ADVANTIA.pdf")
 VLLM_API_URL = "http://localhost:8000/v1/chat/completions"
 MODEL = "Qwen/Qwen2-VL-7B-Instruct"
 
+ENGLISH_PROMPT = "Extract all text from this image. Return the text exactly as shown."
+JAPANESE_PROMPT = """この画像からすべてのテキストを抽出してください。画像に表示されている通りのテキストを正確に返してください。"""
+DETAILED_PROMPT = """Extract all text from this image in a line-by-line fashion. For each line of text in the image:
+1. Identify the exact text content
+2. Note its position (if meaningful)
+3. Report it once only
+Do not repeat lines. If you see the same phrase appearing multiple times, only report it once with a note like "(appears X times)".
+Return the text exactly as shown, organized by lines from top to bottom."""
+
+
+def _ocr_payload(prompt: str, image_base64: str) -> dict:
+    return {
+        "model": MODEL,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:image/png;base64,{image_base64}"},
+                    },
+                ],
+            }
+        ],
+        "temperature": 0.1,
+        "max_tokens": 4096,
+    }
+
 
 def test_pdf_to_images():
     print("=" * 60)
@@ -22,16 +52,9 @@ def test_pdf_to_images():
         images = []
         with fitz.open(str(PDF_PATH)) as doc:
             for page in doc:
-                mat = fitz.Matrix(300 / 72, 300 / 72)
-                pm = page.get_pixmap(matrix=mat, alpha=False)
+                pm = page.get_pixmap(dpi=300, alpha=False)
                 image = Image.frombytes("RGB", (pm.width, pm.height), pm.samples)
-
-                width, height = image.size
-                if width > 1550 or height > 1550:
-                    ratio = min(1550 / width, 1550 / height)
-                    new_width = int(width * ratio)
-                    new_height = int(height * ratio)
-                    image = image.resize((new_width, new_height), Image.LANCZOS)
+                image.thumbnail((1550, 1550), Image.LANCZOS, reducing_gap=3.0)
 
                 images.append(image)
 
@@ -54,7 +77,7 @@ def test_image_encoding(images: List[Image.Image]):
     for i, img in enumerate(images[:3]):
         try:
             buffer = BytesIO()
-            img.save(buffer, format="PNG", optimize=True)
+            img.save(buffer, format="PNG")
             buffer.seek(0)
             img_base64 = base64.b64encode(buffer.read()).decode("utf-8")
             img_size = len(img_base64)
@@ -66,41 +89,13 @@ def test_image_encoding(images: List[Image.Image]):
     return encoded_images
 
 
-def test_ocr_english_prompt(encoded_images: List[str]):
+async def test_ocr_english_prompt(request: Awaitable[httpx.Response]):
     print("\n" + "=" * 60)
     print("测试3: OCR (英文prompt)")
     print("=" * 60)
 
-    if not encoded_images:
-        print("✗ 没有编码的图片可供测试")
-        return
-
     try:
-        prompt = "Extract all text from this image. Return the text exactly as shown."
-
-        payload = {
-            "model": MODEL,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{encoded_images[0]}"
-                            },
-                        },
-                    ],
-                }
-            ],
-            "temperature": 0.1,
-            "max_tokens": 4096,
-        }
-
-        print(f"发送请求到: {VLLM_API_URL}")
-        with httpx.Client(timeout=120.0) as client:
-            response = client.post(f"{VLLM_API_URL}/chat/completions", json=payload)
+        response = await request
 
         if response.status_code == 200:
             result = response.json()
@@ -132,41 +127,13 @@ def test_ocr_english_prompt(encoded_images: List[str]):
         return None
 
 
-def test_ocr_japanese_prompt(encoded_images: List[str]):
+async def test_ocr_japanese_prompt(request: Awaitable[httpx.Response]):
     print("\n" + "=" * 60)
     print("测试4: OCR (日文prompt)")
     print("=" * 60)
 
-    if not encoded_images:
-        print("✗ 没有编码的图片可供测试")
-        return
-
     try:
-        prompt = """この画像からすべてのテキストを抽出してください。画像に表示されている通りのテキストを正確に返してください。"""
-
-        payload = {
-            "model": MODEL,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{encoded_images[0]}"
-                            },
-                        },
-                    ],
-                }
-            ],
-            "temperature": 0.1,
-            "max_tokens": 4096,
-        }
-
-        print(f"发送请求到: {VLLM_API_URL}")
-        with httpx.Client(timeout=120.0) as client:
-            response = client.post(f"{VLLM_API_URL}/chat/completions", json=payload)
+        response = await request
 
         if response.status_code == 200:
             result = response.json()
@@ -193,46 +160,13 @@ def test_ocr_japanese_prompt(encoded_images: List[str]):
         return None
 
 
-def test_detailed_prompt(encoded_images: List[str]):
+async def test_detailed_prompt(request: Awaitable[httpx.Response]):
     print("\n" + "=" * 60)
     print("测试5: OCR (详细prompt)")
     print("=" * 60)
 
-    if not encoded_images:
-        print("✗ 没有编码的图片可供测试")
-        return
-
     try:
-        prompt = """Extract all text from this image in a line-by-line fashion. For each line of text in the image:
-1. Identify the exact text content
-2. Note its position (if meaningful)
-3. Report it once only
-Do not repeat lines. If you see the same phrase appearing multiple times, only report it once with a note like "(appears X times)".
-Return the text exactly as shown, organized by lines from top to bottom."""
-
-        payload = {
-            "model": MODEL,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{encoded_images[0]}"
-                            },
-                        },
-                    ],
-                }
-            ],
-            "temperature": 0.1,
-            "max_tokens": 4096,
-        }
-
-        print(f"发送请求到: {VLLM_API_URL}")
-        with httpx.Client(timeout=120.0) as client:
-            response = client.post(f"{VLLM_API_URL}/chat/completions", json=payload)
+        response = await request
 
         if response.status_code == 200:
             result = response.json()
@@ -261,6 +195,25 @@ Return the text exactly as shown, organized by lines from top to bottom."""
         return None
 
 
+async def run_ocr_tests(encoded_images: List[str]):
+    # 三个prompt互不依赖：共用一个连接池同时发出请求，再按顺序输出结果
+    print(f"\n发送请求到: {VLLM_API_URL}")
+    limits = httpx.Limits(max_keepalive_connections=4)
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        english, japanese, detailed = (
+            asyncio.ensure_future(
+                client.post(
+                    f"{VLLM_API_URL}/chat/completions",
+                    json=_ocr_payload(prompt, encoded_images[0]),
+                )
+            )
+            for prompt in (ENGLISH_PROMPT, JAPANESE_PROMPT, DETAILED_PROMPT)
+        )
+        await test_ocr_english_prompt(english)
+        await test_ocr_japanese_prompt(japanese)
+        await test_detailed_prompt(detailed)
+
+
 def main():
     print("开始诊断OCR问题\n")
 
@@ -277,9 +230,7 @@ def main():
         encoded = test_image_encoding(images)
 
         if encoded:
-            test_ocr_english_prompt(encoded)
-            test_ocr_japanese_prompt(encoded)
-            test_detailed_prompt(encoded)
+            asyncio.run(run_ocr_tests(encoded))
 
     print("\n" + "=" * 60)
     print("诊断完成")
@@ -15,13 +15,13 @@ def generate_secure_token(length: int = 8) -> str:
     return "".join(secrets.choice(alphabet) for _ in range(length))
 
 
-def update_config_token(token: str):
-    """Update access_token in config.toml."""
+def update_config_token(token: str) -> dict | None:
+    """Update access_token in config.toml and return the updated config."""
     config_path = Path(__file__).parent.parent / "config.toml"
 
     if not config_path.exists():
         print(f"Error: config.toml not found at {config_path}")
-        return False
+        return None
 
     with open(config_path, "rb") as f:
         config = tomli.load(f)
@@ -34,7 +34,7 @@ def update_config_token(token: str):
     with open(config_path, "wb") as f:
         tomli_w.dump(config, f)
 
-    return True
+    return config
 
 
 def main():
@@ -46,19 +46,13 @@ def main():
     token = generate_secure_token(length=length)
 
     # Update config.toml
-    if not update_config_token(token):
+    config = update_config_token(token)
+    if config is None:
         print("Error: Failed to update config.toml")
         return 1
 
-    # Display usage
-    app_config = {}
-    try:
-        config_path = Path(__file__).parent.parent / "config.toml"
-        with open(config_path, "rb") as f:
-            config = tomli.load(f)
-            app_config = config.get("app", {})
-    except Exception:
-        pass
+    # Display usage (reuse the config already parsed above)
+    app_config = config["app"]
 
     port = app_config.get("port", 8080)
     host = app_config.get("host", "0.0.0.0")
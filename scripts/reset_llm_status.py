@@ -1,24 +1,35 @@
 #!/usr/bin/env python3
 """Reset all LLM statuses to 'pending' to trigger reprocessing with updated prompt."""
 
+import os
 import sqlite3
 import sys
 from pathlib import Path
 
+# Rows updated per transaction, keeps the WAL file small on large tables
+RESET_BATCH_SIZE = 10_000
+# Passive WAL checkpoint interval, in batches
+CHECKPOINT_EVERY = 10
+
 
 def reset_llm_status(db_path: str):
     """Reset all documents' LLM status to pending."""
-    if not Path(db_path).exists():
+    if not os.path.isfile(db_path):
         print(f"Error: Database file not found at {db_path}")
         sys.exit(1)
 
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-65536")
 
     try:
         # Check how many documents will be reset
         cursor.execute(
-            "SELECT COUNT(*) FROM documents WHERE llm_status IN ('done', 'processing', 'failed')"
+            "SELECT COUNT(*) FROM documents "
+            "WHERE llm_status IN ('done', 'processing', 'failed') OR retry_count != 0"
         )
         count = cursor.fetchone()[0]
 
@@ -35,11 +46,38 @@ def reset_llm_status(db_path: str):
             conn.close()
             return
 
-        # Reset LLM status for all documents
+        # Databases not yet migrated by the app have no retry backoff column
         cursor.execute(
-            "UPDATE documents SET llm_status = 'pending', properties = NULL, extracted_model = NULL"
+            "SELECT COUNT(*) FROM pragma_table_info('documents') WHERE name = 'next_retry_at'"
         )
-        conn.commit()
+        reset_backoff = ", next_retry_at = 0" if cursor.fetchone()[0] else ""
+
+        # Reset LLM status one id range per transaction, only rewriting rows
+        # that still carry a non-pending status, extraction results or used
+        # retries. Clearing retry_count is required: the processor skips
+        # documents that used up their automatic retries, and it needs the
+        # OCR text, so OCR that gave up is requeued as well.
+        cursor.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM documents")
+        min_id, max_id = cursor.fetchone()
+        starts = range(min_id, max_id + 1, RESET_BATCH_SIZE)
+        for batch, start in enumerate(starts, 1):
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                "UPDATE documents SET llm_status = 'pending', properties = NULL, extracted_model = NULL, "
+                "ocr_status = CASE WHEN ocr_status = 'failed' THEN 'pending' ELSE ocr_status END, "
+                f"retry_count = 0{reset_backoff} "
+                "WHERE id BETWEEN ? AND ? "
+                "AND (llm_status != 'pending' OR properties IS NOT NULL OR extracted_model IS NOT NULL "
+                "OR retry_count != 0)",
+                (start, start + RESET_BATCH_SIZE - 1),
+            )
+            conn.commit()
+            if batch % CHECKPOINT_EVERY == 0:
+                cursor.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+        # Refresh planner statistics after touching every row
+        cursor.execute("ANALYZE documents")
+        cursor.execute("PRAGMA optimize")
 
         print(f"✓ Successfully reset LLM status for {count} document(s).")
         print("  The processor will reprocess all documents with the updated prompt.")
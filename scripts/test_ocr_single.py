@@ -19,18 +19,19 @@ async def test_single_doc():
         
         # 检查处理结果
         doc = db.get_document(doc_id)
-        print(f'OCR状态: {doc[\"ocr_status\"]}')
-        print(f'LLM状态: {doc[\"llm_status\"]}')
+        print(f'OCR状态: {doc["ocr_status"]}')
+        print(f'LLM状态: {doc["llm_status"]}')
         if doc['ocr_text']:
-            print(f'OCR文本长度: {len(doc[\"ocr_text\"])} 字符')
-            print(f'OCR文本预览: {doc[\"ocr_text\"][:300]}')
+            print(f'OCR文本长度: {len(doc["ocr_text"])} 字符')
+            print(f'OCR文本预览: {doc["ocr_text"][:300]}')
         if doc.get('properties'):
-            print(f'提取的属性数量: {len(doc[\"properties\"])}')
-            print(f'属性: {doc[\"properties\"]}')
+            print(f'提取的属性数量: {len(doc["properties"])}')
+            print(f'属性: {doc["properties"]}')
     else:
         print('没有待处理的文档')
     
-    processor.close()
+    await processor.close()
+    db.close()
 
 if __name__ == '__main__':
     asyncio.run(test_single_doc())
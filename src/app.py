@@ -1,23 +1,46 @@
 import asyncio
+import copy
+import functools
 import hashlib
-import shutil
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
 
 import fitz
 import tomli
-import tomli_w
 from fastapi import FastAPI, File, HTTPException, UploadFile, Request, BackgroundTasks
-from fastapi.responses import HTMLResponse, JSONResponse, Response
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    ORJSONResponse,
+    Response,
+)
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
 from PIL import Image
 
+from src.config import save_config
 from src.models import Database
+from src.previews import (
+    PREVIEW_MAX_SIZE,
+    THUMBNAIL_FAST_WIDTH,
+    THUMBNAIL_WIDTH,
+    render_preview,
+    render_thumbnail,
+    render_to_bytes,
+)
 from src.processor import DocumentProcessor
 
 
-app = FastAPI(title="Housing OCR")
+app = FastAPI(title="Housing OCR", default_response_class=ORJSONResponse)
 
 
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -31,10 +54,50 @@ def load_config():
         return tomli.load(f)
 
 
-def save_config(config: dict):
-    config_path = PROJECT_ROOT / "config.toml"
-    with open(config_path, "wb") as f:
-        tomli_w.dump(config, f)
+CONFIG_SAVE_DELAY = 0.25
+_config_save_handle: asyncio.TimerHandle | None = None
+# 最近一次写入任务：保留引用避免被回收，关闭时等待其完成
+_config_save_task: asyncio.Task | None = None
+# 写入串行执行，快照在持锁后获取，保证最新的配置最后落盘
+_config_save_lock = asyncio.Lock()
+
+
+def save_config_debounced():
+    """Coalesce bursts of config changes into a single write shortly after the last one."""
+    global _config_save_handle
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        save_config(config)
+        return
+    if _config_save_handle is not None:
+        _config_save_handle.cancel()
+    _config_save_handle = loop.call_later(CONFIG_SAVE_DELAY, _start_config_flush)
+
+
+def _start_config_flush():
+    global _config_save_handle, _config_save_task
+    _config_save_handle = None
+    _config_save_task = asyncio.create_task(_flush_config())
+
+
+async def _flush_config():
+    async with _config_save_lock:
+        snapshot = copy.deepcopy(config)
+        try:
+            await asyncio.to_thread(save_config, snapshot)
+        except Exception as e:
+            print(f"Error saving config: {e}")
+
+
+async def flush_pending_config():
+    """Write out a pending debounced config save now and wait for writes in progress."""
+    if _config_save_handle is not None:
+        _config_save_handle.cancel()
+        _start_config_flush()
+    if _config_save_task is not None:
+        # 锁按先来先得释放，最后一个任务完成即之前的写入都已完成
+        await _config_save_task
 
 
 config = load_config()
@@ -78,60 +141,167 @@ class TokenAuthMiddleware(BaseHTTPMiddleware):
 app.add_middleware(TokenAuthMiddleware, access_token=access_token)
 
 
-db = Database(config["app"]["db_path"])
+class PreviewAwareGZipMiddleware(GZipMiddleware):
+    """GZip responses except JPEG previews, which are already compressed."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith("/api/preview/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# 文档列表、通勤时间等大型 JSON 重复度高，压缩后体积明显减小
+app.add_middleware(PreviewAwareGZipMiddleware, minimum_size=1024, compresslevel=6)
+
+
+UPLOAD_DIR = Path(config["app"]["upload_dir"]).resolve()
+UPLOAD_DIR.mkdir(exist_ok=True)
+DB_PATH = Path(config["app"]["db_path"]).resolve()
+
+db = Database(str(DB_PATH))
 
 
 def update_models_callback(models):
     config["llm"]["models"] = list(models)
-    save_config(config)
+    save_config_debounced()
 
 
 processor = DocumentProcessor(config, db, update_models_callback)
+processor_task: asyncio.Task | None = None
+rehash_task: asyncio.Task | None = None
+# 关闭时通知重算哈希的工作线程在下一个文件前退出
+_rehash_stop = threading.Event()
+# 关闭时最多等待处理器退出这么多秒 (略长于处理器自身的排空超时)；
+# 超时后强制取消，未完成的文档下次启动时会被重新处理
+PROCESSOR_SHUTDOWN_TIMEOUT = processor.shutdown_timeout_seconds + 5
+
+
+class HashedStaticFiles(StaticFiles):
+    """Static files that mark content-hashed build output as immutable."""
+
+    # Vite 默认输出 name-<8位 base64url 哈希>.ext
+    HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8}\.\w+$")
+
+    def file_response(
+        self,
+        full_path: os.PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if self.HASHED_NAME.search(os.fspath(full_path)):
+            # 文件名随内容变化，浏览器可以永久缓存，无需重新验证
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
 
 
 FRONTEND_DIST = PROJECT_ROOT / "frontend" / "dist"
+FRONTEND_INDEX = FRONTEND_DIST / "index.html"
+# (mtime_ns, 内容)：index.html 只在重新构建后才重新读取
+_frontend_index_cache: Optional[Tuple[int, bytes]] = None
 if FRONTEND_DIST.exists():
-    app.mount("/assets", StaticFiles(directory=FRONTEND_DIST / "assets"), name="assets")
+    app.mount("/assets", HashedStaticFiles(directory=FRONTEND_DIST / "assets"), name="assets")
 
 
 @app.on_event("startup")
 async def startup_event():
-    import asyncio
+    global preview_pool, processor_task, rehash_task
+    preview_pool = ProcessPoolExecutor(
+        max_workers=PREVIEW_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+    processor_task = asyncio.create_task(processor.process_queue())
+    # 仅在仍有旧哈希时启动 (部分索引探测，无需全表扫描)；中途关闭的话下次启动继续
+    if await asyncio.to_thread(db.has_legacy_file_hashes):
+        rehash_task = asyncio.create_task(asyncio.to_thread(_rehash_legacy_documents))
+
 
-    asyncio.create_task(processor.process_queue())
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Check whether the request's If-None-Match header matches the given ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
 
 
 @app.get("/", response_class=HTMLResponse)
-async def root():
-    frontend_index = FRONTEND_DIST / "index.html"
-    if frontend_index.exists():
-        with open(frontend_index, encoding="utf-8") as f:
-            content = f.read()
-        response = HTMLResponse(content=content)
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        return response
-    raise HTTPException(status_code=404, detail="前端资源未找到，请先运行 'just build'")
+async def root(request: Request):
+    try:
+        # 允许浏览器缓存，但每次都需要用 ETag 重新验证，保证重新构建后立即生效
+        mtime_ns = FRONTEND_INDEX.stat().st_mtime_ns
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=404, detail="前端资源未找到，请先运行 'just build'"
+        )
+    etag = f'"{mtime_ns}"'
+    headers = {"Cache-Control": "no-cache", "ETag": etag}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    global _frontend_index_cache
+    if _frontend_index_cache is None or _frontend_index_cache[0] != mtime_ns:
+        _frontend_index_cache = (mtime_ns, await asyncio.to_thread(FRONTEND_INDEX.read_bytes))
+    return HTMLResponse(content=_frontend_index_cache[1], headers=headers)
+
+
+UPLOAD_CHUNK_SIZE = 1 << 20
+# mkstemp 创建的临时文件权限为 0600，保存前恢复为按 umask 创建普通文件时的权限
+_umask = os.umask(0)
+os.umask(_umask)
+UPLOAD_FILE_MODE = 0o666 & ~_umask
+# 上传去重使用 BLAKE2b (40位十六进制)；旧版本使用 MD5 (32位)
+FILE_HASH_DIGEST_SIZE = 20
+
+
+def _new_file_hash():
+    return hashlib.blake2b(digest_size=FILE_HASH_DIGEST_SIZE)
+
+
+def _spool_upload(src: BinaryIO, dst: BinaryIO) -> str:
+    """Copy an upload to dst in 1 MiB chunks and return its content hash."""
+    file_hash = _new_file_hash()
+    while chunk := src.read(UPLOAD_CHUNK_SIZE):
+        file_hash.update(chunk)
+        dst.write(chunk)
+    return file_hash.hexdigest()
+
+
+def _rehash_legacy_documents():
+    """一次性迁移：将旧文档的 MD5 哈希重算为 BLAKE2b，使去重继续覆盖旧文档"""
+    for doc in db.get_legacy_hash_documents():
+        if _rehash_stop.is_set():
+            return
+        try:
+            with open(UPLOAD_DIR / doc["filename"], "rb") as f:
+                file_hash = hashlib.file_digest(f, _new_file_hash).hexdigest()
+        except OSError as e:
+            print(f"Error rehashing document {doc['id']}: {e}")
+            continue
+        db.update_file_hash(doc["id"], file_hash)
 
 
 @app.post("/api/upload")
 async def upload_document(
     file: UploadFile = File(...), background_tasks: BackgroundTasks = None
 ):
-    upload_dir = Path(config["app"]["upload_dir"])
-    upload_dir.mkdir(exist_ok=True)
-
-    file.file.seek(0)
-    hash_md5 = hashlib.md5()
-    while chunk := file.file.read(8192):
-        hash_md5.update(chunk)
-    file_hash = hash_md5.hexdigest()
-    file.file.seek(0)
-
-    existing_doc = db.get_document_by_hash(file_hash)
+    # 边写入临时文件边计算哈希，只需读取一次上传内容；整个拷贝在工作线程中完成
+    fd, tmp_name = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+    tmp_path = Path(tmp_name)
+    try:
+        await file.seek(0)
+        with os.fdopen(fd, "wb") as buffer:
+            file_hash = await asyncio.to_thread(_spool_upload, file.file, buffer)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        await file.close()
+
+    existing_doc = await asyncio.to_thread(db.get_document_by_hash, file_hash)
     if existing_doc:
-        return JSONResponse(
+        tmp_path.unlink(missing_ok=True)
+        return ORJSONResponse(
             content={
                 "id": existing_doc["id"],
                 "filename": existing_doc["original_filename"]
@@ -143,132 +313,128 @@ async def upload_document(
 
     file_ext = Path(file.filename).suffix
     saved_filename = f"{file_hash}{file_ext}"
-    file_path = upload_dir / saved_filename
+    file_path = UPLOAD_DIR / saved_filename
+    os.chmod(tmp_path, UPLOAD_FILE_MODE)
+    os.replace(tmp_path, file_path)
 
     original_filename = file.filename
-    doc_id = db.create_document(saved_filename, original_filename)
-    db.update_file_hash(doc_id, file_hash)
-
-    async def save_file_and_extract_dimensions():
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    doc_id = await asyncio.to_thread(
+        db.create_document, saved_filename, original_filename, file_hash
+    )
+    processor.notify()
 
+    def extract_dimensions():
         try:
-            if file_path.suffix.lower() == ".pdf":
-                with fitz.open(file_path) as doc_obj:
-                    page = doc_obj[0]
-                    mat = fitz.Matrix(2.0, 2.0)
-                    pm = page.get_pixmap(matrix=mat, alpha=False)
-                    width = pm.width
-                    height = pm.height
-            else:
-                with Image.open(file_path) as img:
-                    width, height = img.size
+            width, height = _measure_document(file_path)
             db.update_image_dimensions(doc_id, width, height)
         except Exception as e:
             print(f"Error getting image dimensions: {e}")
 
-    background_tasks.add_task(save_file_and_extract_dimensions)
+    background_tasks.add_task(extract_dimensions)
 
-    return JSONResponse(
+    return ORJSONResponse(
         content={"id": doc_id, "filename": original_filename, "duplicate": False}
     )
 
 
+def _measure_document(file_path: Path) -> tuple[int, int]:
+    """读取文档首页尺寸 (PDF 按2倍渲染尺寸计算)"""
+    if file_path.suffix.lower() == ".pdf":
+        with fitz.open(file_path) as doc_obj:
+            # 与2倍渲染的像素尺寸一致，但只需变换页面矩形，无需栅格化
+            bbox = (doc_obj[0].rect * fitz.Matrix(2.0, 2.0)).irect
+            return bbox.width, bbox.height
+    with Image.open(file_path) as img:
+        return img.size
+
+
 @app.get("/api/documents")
 async def get_documents():
-    documents = db.get_all_documents()
-    return JSONResponse(content={"documents": documents})
+    documents = await asyncio.to_thread(db.get_all_documents)
+    return ORJSONResponse(content={"documents": documents})
 
 
 @app.get("/api/preview-info/{doc_id}")
 async def get_preview_info(doc_id: int):
     """获取文档预览信息，包括尺寸和方向"""
-    doc = db.get_document(doc_id)
+    doc = await asyncio.to_thread(db.get_document, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="文档不存在")
-    upload_dir = Path(config["app"]["upload_dir"])
-    file_path = upload_dir / doc["filename"]
+    file_path = UPLOAD_DIR / doc["filename"]
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="文件不存在")
 
     try:
-        if file_path.suffix.lower() == ".pdf":
-            with fitz.open(file_path) as doc_obj:
-                page = doc_obj[0]
-                mat = fitz.Matrix(2.0, 2.0)
-                pm = page.get_pixmap(matrix=mat, alpha=False)
-                width = pm.width
-                height = pm.height
-        else:
-            with Image.open(file_path) as img:
-                width, height = img.size
+        # 优先使用上传时记录的尺寸；缺失时再解析文件并写回数据库
+        width, height = doc.get("image_width"), doc.get("image_height")
+        if not width or not height:
+            # PyMuPDF/PIL 解析是阻塞操作，放到线程中执行
+            width, height = await asyncio.to_thread(_measure_document, file_path)
+            await asyncio.to_thread(
+                db.update_image_dimensions, doc_id, width, height
+            )
 
         orientation = "landscape" if width > height else "portrait"
 
-        return JSONResponse(
+        return ORJSONResponse(
             content={"width": width, "height": height, "orientation": orientation}
         )
     except Exception as e:
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        return ORJSONResponse(content={"error": str(e)}, status_code=500)
 
 
 @app.get("/api/documents/{doc_id}")
 async def get_document(doc_id: int):
-    doc = db.get_document(doc_id)
+    doc = await asyncio.to_thread(db.get_document, doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="文档不存在")
-    return JSONResponse(content=doc)
+    return ORJSONResponse(content=doc)
 
 
 @app.post("/api/documents/{doc_id}/update")
 async def update_document(doc_id: int, properties: dict):
-    db.update_llm_status(doc_id, "done", properties)
-    return JSONResponse(content={"success": True})
+    await asyncio.to_thread(db.update_llm_status, doc_id, "done", properties)
+    return ORJSONResponse(content={"success": True})
 
 
 @app.post("/api/documents/{doc_id}/favorite")
 async def toggle_favorite(doc_id: int):
-    favorite = db.toggle_favorite(doc_id)
-    return JSONResponse(content={"success": True, "favorite": favorite})
+    favorite = await asyncio.to_thread(db.toggle_favorite, doc_id)
+    return ORJSONResponse(content={"success": True, "favorite": favorite})
 
 
 @app.delete("/api/documents/{doc_id}")
 async def delete_document(doc_id: int):
-    doc = db.get_document(doc_id)
-    if not doc:
+    filename = await asyncio.to_thread(db.delete_document, doc_id)
+    if filename is None:
         raise HTTPException(status_code=404, detail="文档不存在")
 
-    upload_dir = Path(config["app"]["upload_dir"])
-    file_path = upload_dir / doc["filename"]
-
-    db.delete_document(doc_id, str(file_path))
-    return JSONResponse(content={"success": True})
+    try:
+        await asyncio.to_thread((UPLOAD_DIR / filename).unlink, missing_ok=True)
+    except OSError as e:
+        print(f"Error deleting file {filename}: {e}")
+    return ORJSONResponse(content={"success": True})
 
 
 @app.post("/api/documents/{doc_id}/retry_llm")
 async def retry_llm(doc_id: int):
-    doc = db.get_document(doc_id)
-    if not doc:
+    if not await asyncio.to_thread(db.reset_llm_status, doc_id):
         raise HTTPException(status_code=404, detail="文档不存在")
-
-    db.reset_llm_status(doc_id)
-    return JSONResponse(content={"success": True})
+    processor.notify()
+    return ORJSONResponse(content={"success": True})
 
 
 @app.post("/api/documents/{doc_id}/retry_ocr")
 async def retry_ocr(doc_id: int):
-    doc = db.get_document(doc_id)
-    if not doc:
+    if not await asyncio.to_thread(db.reset_ocr_status, doc_id):
         raise HTTPException(status_code=404, detail="文档不存在")
-
-    db.reset_ocr_status(doc_id)
-    return JSONResponse(content={"success": True})
+    processor.notify()
+    return ORJSONResponse(content={"success": True})
 
 
 @app.get("/api/models")
 async def get_models():
-    return JSONResponse(content={"models": config["llm"].get("models", [])})
+    return ORJSONResponse(content={"models": config["llm"].get("models", [])})
 
 
 @app.post("/api/models")
@@ -288,12 +454,14 @@ async def add_model(model: dict):
 
     new_models.append(model_name)
     config["llm"]["models"] = new_models
-    save_config(config)
+    save_config_debounced()
 
     processor.llm_extractor.models = list(new_models)
-    retried_count = db.retry_all_failed_llm()
+    retried_count = await asyncio.to_thread(db.retry_all_failed_llm)
+    if retried_count:
+        processor.notify()
 
-    return JSONResponse(
+    return ORJSONResponse(
         content={
             "success": True,
             "models": new_models,
@@ -320,12 +488,14 @@ async def delete_model(request: dict):
 
     models.remove(model_name)
     config["llm"]["models"] = models
-    save_config(config)
+    save_config_debounced()
 
     processor.llm_extractor.models = list(models)
-    retried_count = db.retry_all_failed_llm()
+    retried_count = await asyncio.to_thread(db.retry_all_failed_llm)
+    if retried_count:
+        processor.notify()
 
-    return JSONResponse(
+    return ORJSONResponse(
         content={
             "success": True,
             "models": models,
@@ -343,12 +513,14 @@ async def reorder_models(request: dict):
     if "llm" not in config:
         config["llm"] = {}
     config["llm"]["models"] = list(models)
-    save_config(config)
+    save_config_debounced()
 
     processor.llm_extractor.models = list(models)
-    retried_count = db.retry_all_failed_llm()
+    retried_count = await asyncio.to_thread(db.retry_all_failed_llm)
+    if retried_count:
+        processor.notify()
 
-    return JSONResponse(
+    return ORJSONResponse(
         content={
             "success": True,
             "models": models,
@@ -360,118 +532,165 @@ async def reorder_models(request: dict):
 @app.post("/api/documents/cleanup")
 async def cleanup_documents():
     """删除所有非收藏的文档"""
-    upload_dir = Path(config["app"]["upload_dir"])
 
-    all_docs = db.get_all_documents()
-    unfavorited = [d for d in all_docs if d.get("favorite") != 1]
+    filenames = await asyncio.to_thread(db.delete_unfavorited_documents)
+    await asyncio.gather(
+        *(
+            asyncio.to_thread((UPLOAD_DIR / filename).unlink, missing_ok=True)
+            for filename in filenames
+        ),
+        return_exceptions=True,
+    )
+    deleted_count = len(filenames)
+
+    return ORJSONResponse(content={"success": True, "deleted_count": deleted_count})
 
-    deleted_count = 0
-    for doc in unfavorited:
-        file_path = upload_dir / doc["filename"]
-        db.delete_document(doc["id"], str(file_path))
-        deleted_count += 1
 
-    return JSONResponse(content={"success": True, "deleted_count": deleted_count})
+PREVIEW_CACHE_DIR = PROJECT_ROOT / "cache" / "previews"
+PREVIEW_CACHE_MAX_ENTRIES = 500
+PREVIEW_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+
+# 预览渲染是纯 CPU 任务，放到独立进程中执行，避免占用事件循环和 GIL
+preview_pool: ProcessPoolExecutor | None = None
+
+
+def _lookup_preview_cache(doc_id: int, file_path: Path, variant: str) -> Tuple[Path, bool]:
+    """Return the cache path for a preview and whether it is already cached.
+
+    The path is keyed by doc id, source mtime and variant; a cache hit has its
+    mtime refreshed. Raises FileNotFoundError if the source file is missing.
+    """
+    mtime_ns = file_path.stat().st_mtime_ns
+    cache_path = PREVIEW_CACHE_DIR / f"{doc_id}_{mtime_ns}_{variant}.jpg"
+    try:
+        # 更新访问时间，使淘汰顺序接近 LRU；文件不存在即未缓存
+        os.utime(cache_path)
+    except FileNotFoundError:
+        return cache_path, False
+    return cache_path, True
+
+
+def _write_preview_cache(cache_path: Path, data: bytes):
+    """Write a rendered preview into the cache atomically and evict the oldest entries."""
+    PREVIEW_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=PREVIEW_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+    # scandir 直接给出文件名与类型，避免为每个条目构造 Path
+    with os.scandir(PREVIEW_CACHE_DIR) as it:
+        entries = [
+            entry
+            for entry in it
+            if entry.name.endswith(".jpg") and entry.is_file(follow_symlinks=False)
+        ]
+    if len(entries) <= PREVIEW_CACHE_MAX_ENTRIES:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for stale in entries[PREVIEW_CACHE_MAX_ENTRIES:]:
+        Path(stale.path).unlink(missing_ok=True)
 
 
 @app.get("/api/preview/{doc_id}")
-async def preview_document(doc_id: int, thumbnail: bool = False):
-    """获取文档预览，支持缩略图模式"""
-    doc = db.get_document(doc_id)
-    if not doc:
+async def preview_document(
+    request: Request, doc_id: int, thumbnail: bool = False, fast: bool = False
+):
+    """获取文档预览，支持缩略图模式
+
+    缩略图始终使用 BILINEAR 重采样，仅大图预览使用 LANCZOS。
+    fast=True 用于列表等概览场景：缩略图宽度为256px，大图预览也改用 BILINEAR。
+    """
+    # 只查询文件名：列表页每张缩略图都会请求，多数请求以 304 结束
+    filename = await asyncio.to_thread(db.get_document_filename, doc_id)
+    if not filename:
         raise HTTPException(status_code=404, detail="文档不存在")
-    upload_dir = Path(config["app"]["upload_dir"])
-    file_path = upload_dir / doc["filename"]
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="文件不存在")
-
-    import io
+    file_path = UPLOAD_DIR / filename
 
+    # 300px 级别的缩略图用 BILINEAR 即可，LANCZOS 的8抽头卷积只留给大图预览
+    if fast or thumbnail:
+        resample = Image.Resampling.BILINEAR
+    else:
+        resample = Image.Resampling.LANCZOS
     if thumbnail:
-        # 生成缩略图 (宽度300px，保持宽高比)
-        max_width = 300
-
-        if file_path.suffix.lower() == ".pdf":
-            with fitz.open(file_path) as doc_obj:
-                page = doc_obj[0]
-                mat = fitz.Matrix(2.0, 2.0)
-                pm = page.get_pixmap(matrix=mat, alpha=False)
-                img_bytes = pm.tobytes("ppm")
-                img = Image.open(io.BytesIO(img_bytes))
-                img.load()  # Load image data into memory before closing file
-        else:
-            with Image.open(file_path) as opened_img:
-                img = opened_img.copy()  # Copy the image to keep it after file closes
-
-        # 计算缩略图尺寸
-        ratio = max_width / img.width
-        new_height = int(img.height * ratio)
-
-        # 生成缩略图
-        img.thumbnail((max_width, new_height), Image.Resampling.LANCZOS)
-
-        # 转换为JPEG (质量85，平衡质量和速度)
-        buffer = io.BytesIO()
-        img.convert("RGB").save(buffer, format="JPEG", quality=85, optimize=True)
-
-        # 返回缩略图
-        buffer.seek(0)
-        return Response(
-            content=buffer.getvalue(),
-            media_type="image/jpeg",
-            headers={
-                "Cache-Control": "public, max-age=3600",
-                "Content-Disposition": f'inline; filename="thumb_{doc["filename"]}.jpg"',
-            },
+        size = THUMBNAIL_FAST_WIDTH if fast else THUMBNAIL_WIDTH
+        render = functools.partial(
+            render_to_bytes,
+            render_thumbnail,
+            file_path,
+            max_width=size,
+            resample=resample,
         )
+        headers = {
+            "Content-Disposition": f'inline; filename="thumb_{filename}.jpg"',
+        }
     else:
-        # 返回原图 (有尺寸限制)
-        MAX_SIZE = 1400
-
-        if file_path.suffix.lower() == ".pdf":
-            with fitz.open(file_path) as doc_obj:
-                page = doc_obj[0]
-                mat = fitz.Matrix(2.0, 2.0)
-                pm = page.get_pixmap(matrix=mat, alpha=False)
-                img = Image.frombytes("RGB", (pm.width, pm.height), pm.samples)
-
-                if img.width > MAX_SIZE or img.height > MAX_SIZE:
-                    ratio = min(MAX_SIZE / img.width, MAX_SIZE / img.height)
-                    new_width = int(img.width * ratio)
-                    new_height = int(img.height * ratio)
-                    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-            buffer = io.BytesIO()
-            img.save(buffer, format="JPEG", quality=90, optimize=True)
-            buffer.seek(0)
-            return Response(content=buffer.getvalue(), media_type="image/jpeg")
-
-        with Image.open(file_path) as opened_img:
-            img = opened_img.copy()
-        if img.width > MAX_SIZE or img.height > MAX_SIZE:
-            ratio = min(MAX_SIZE / img.width, MAX_SIZE / img.height)
-            new_width = int(img.width * ratio)
-            new_height = int(img.height * ratio)
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        buffer = io.BytesIO()
-        img.convert("RGB").save(buffer, format="JPEG", quality=90, optimize=True)
-        buffer.seek(0)
-        return Response(content=buffer.getvalue(), media_type="image/jpeg")
+        size = PREVIEW_MAX_SIZE
+        render = functools.partial(
+            render_to_bytes, render_preview, file_path, resample=resample
+        )
+        headers = {}
+
+    variant = f"{size}f" if fast else str(size)
+    try:
+        # stat 源文件同时完成存在性检查，与缓存查找合并为一次线程切换
+        cache_path, cached = await asyncio.to_thread(
+            _lookup_preview_cache, doc_id, file_path, variant
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    # 上传文件按内容哈希命名且不会被修改，预览可长期缓存
+    headers["ETag"] = f'"{cache_path.stem}"'
+    headers["Cache-Control"] = "public, max-age=3600, immutable"
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if not cached:
+        # preview_pool 未初始化时 (如未触发 startup) 退回默认线程池
+        data = await asyncio.get_running_loop().run_in_executor(preview_pool, render)
+        try:
+            await asyncio.to_thread(_write_preview_cache, cache_path, data)
+        except OSError as e:
+            print(f"Error writing preview cache: {e}")
+            # 缓存不可写时直接返回渲染结果
+            return Response(content=data, media_type="image/jpeg", headers=headers)
+
+    return FileResponse(cache_path, media_type="image/jpeg", headers=headers)
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Gracefully shutdown processor and wait for tasks to complete."""
     processor._shutdown_event.set()
-    await asyncio.sleep(0.5)
+    processor.notify()
+    _rehash_stop.set()
+    if processor_task is not None:
+        # 等待队列循环真正退出 (空闲时立即返回)，而不是固定睡眠
+        _, still_running = await asyncio.wait(
+            [processor_task], timeout=PROCESSOR_SHUTDOWN_TIMEOUT
+        )
+        if still_running:
+            # 取消处理器会一并取消并等待其在途任务，之后才能关闭客户端和数据库
+            processor_task.cancel()
+            await asyncio.gather(processor_task, return_exceptions=True)
     await processor.close()
+    await flush_pending_config()
+    if preview_pool is not None:
+        preview_pool.shutdown(cancel_futures=True)
+    if rehash_task is not None:
+        # 工作线程无法被取消，等它处理完当前文件后退出再关闭数据库
+        await asyncio.gather(rehash_task, return_exceptions=True)
+    db.close()
 
 
 @app.get("/api/locations")
 async def get_locations():
-    locations = db.get_all_locations()
-    return JSONResponse(content={"locations": locations})
+    locations = await asyncio.to_thread(db.get_all_locations)
+    return ORJSONResponse(content={"locations": locations})
 
 
 @app.post("/api/locations")
@@ -480,21 +699,21 @@ async def add_location(request: dict):
     if not name:
         raise HTTPException(status_code=400, detail="位置名称不能为空")
 
-    location = db.add_location(name)
-    return JSONResponse(content={"success": True, "location": location})
+    location = await asyncio.to_thread(db.add_location, name)
+    return ORJSONResponse(content={"success": True, "location": location})
 
 
 @app.delete("/api/locations/{location_id}")
 async def delete_location(location_id: int):
-    db.delete_location(location_id)
-    return JSONResponse(content={"success": True})
+    await asyncio.to_thread(db.delete_location, location_id)
+    return ORJSONResponse(content={"success": True})
 
 
 @app.post("/api/locations/{location_id}/display")
 async def update_location_display(location_id: int, request: dict):
     show_in_tag = request.get("show_in_tag", 0)
-    db.update_location_display(location_id, show_in_tag)
-    return JSONResponse(content={"success": True})
+    await asyncio.to_thread(db.update_location_display, location_id, show_in_tag)
+    return ORJSONResponse(content={"success": True})
 
 
 @app.post("/api/locations/reorder")
@@ -503,21 +722,19 @@ async def reorder_locations(request: dict):
     if not location_ids:
         raise HTTPException(status_code=400, detail="位置列表不能为空")
 
-    db.reorder_locations(location_ids)
-    return JSONResponse(content={"success": True})
+    await asyncio.to_thread(db.reorder_locations, location_ids)
+    return ORJSONResponse(content={"success": True})
 
 
 @app.get("/api/travel-times")
 async def get_travel_times():
-    import time
-
     start = time.time()
-    durations = db.get_all_travel_times()
+    durations = await asyncio.to_thread(db.get_all_travel_times)
     elapsed = time.time() - start
     print(
         f"get_travel_times completed in {elapsed:.3f}s, returned {len(durations)} records"
     )
-    return JSONResponse(content={"travel_times": durations})
+    return ORJSONResponse(content={"travel_times": durations})
 
 
 @app.post("/api/travel-times/batch")
@@ -527,6 +744,7 @@ async def set_travel_times_batch(request: dict):
     if not isinstance(durations, list):
         raise HTTPException(status_code=400, detail="travel_times必须是数组")
 
+    rows = []
     for d in durations:
         station_name = d.get("station_name", "").strip()
         location_id = d.get("location_id")
@@ -535,5 +753,8 @@ async def set_travel_times_batch(request: dict):
         if not station_name or location_id is None or duration is None:
             continue
 
-        db.set_travel_time(station_name, location_id, duration)
-    return JSONResponse(content={"success": True})
+        rows.append((station_name, location_id, duration))
+
+    if rows:
+        await asyncio.to_thread(db.set_travel_times, rows)
+    return ORJSONResponse(content={"success": True})
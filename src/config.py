@@ -0,0 +1,39 @@
+"""Reading and writing the project's config.toml."""
+
+import os
+import stat
+import tempfile
+from pathlib import Path
+
+import tomli_w
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+CONFIG_PATH = PROJECT_ROOT / "config.toml"
+
+# 新建配置文件时按 umask 得到的权限；umask 只在导入时读取，避免写入线程临时修改进程 umask
+_umask = os.umask(0)
+os.umask(_umask)
+DEFAULT_CONFIG_MODE = 0o666 & ~_umask
+
+
+def _config_file_mode() -> int:
+    """Return the existing config.toml's permissions, or the umask default for a new file."""
+    try:
+        return stat.S_IMODE(CONFIG_PATH.stat().st_mode)
+    except FileNotFoundError:
+        return DEFAULT_CONFIG_MODE
+
+
+def save_config(config: dict):
+    """Write config.toml atomically."""
+    # 先写临时文件再原子替换，写入中途出错也不会留下半个配置文件
+    fd, tmp_path = tempfile.mkstemp(dir=CONFIG_PATH.parent, suffix=".toml.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            tomli_w.dump(config, f)
+        # mkstemp 创建的文件权限为 0600，沿用原配置文件的权限
+        os.chmod(tmp_path, _config_file_mode())
+        os.replace(tmp_path, CONFIG_PATH)
+    except Exception:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
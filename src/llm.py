@@ -1,9 +1,10 @@
 import httpx
 import asyncio
 from typing import Dict, Any, Optional
-import json
+import orjson
 import time
 import re
+import traceback
 
 ERA_START_YEARS = {
     "明治": 1868,
@@ -13,12 +14,13 @@ ERA_START_YEARS = {
     "令和": 2019,
 }
 
+# 模块加载时预编译，每次转换不再经过 re 模块的缓存查找
 ERA_PATTERNS = [
-    (r"令和(\d+)年?", 2019),
-    (r"平成(\d+)年?", 1989),
-    (r"昭和(\d+)年?", 1926),
-    (r"大正(\d+)年?", 1912),
-    (r"明治(\d+)年?", 1867),
+    (re.compile(r"令和(\d+)年?"), 2019),
+    (re.compile(r"平成(\d+)年?"), 1989),
+    (re.compile(r"昭和(\d+)年?"), 1926),
+    (re.compile(r"大正(\d+)年?"), 1912),
+    (re.compile(r"明治(\d+)年?"), 1867),
 ]
 
 
@@ -32,7 +34,7 @@ def convert_japanese_era_to_western(era_text: str) -> str:
         return era_text
 
     for pattern, base_year in ERA_PATTERNS:
-        match = re.search(pattern, era_text)
+        match = pattern.search(era_text)
         if match:
             era_year = int(match.group(1))
             western_year = base_year + era_year - 1
@@ -70,7 +72,15 @@ class LLMExtractor:
 
     async def _get_client(self) -> httpx.AsyncClient:
         if self._client is None:
-            self._client = httpx.AsyncClient(timeout=120.0)
+            # 认证等固定请求头只在建立连接池时设置一次
+            self._client = httpx.AsyncClient(
+                timeout=120.0,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "HTTP-Referer": "http://localhost:8080",
+                    "X-Title": "Housing OCR",
+                },
+            )
         return self._client
 
     def _extract_json(self, text: str) -> dict:
@@ -78,7 +88,7 @@ class LLMExtractor:
         end = text.rfind("}") + 1
         if start != -1 and end > start:
             json_str = text[start:end]
-            return json.loads(json_str)
+            return orjson.loads(json_str)
         raise ValueError("无法从响应中提取JSON")
 
     async def extract_properties(
@@ -197,11 +207,6 @@ Incorrect output (DO NOT do this):
                     self.base_url,
                     json=payload,
                     timeout=self.request_timeout_seconds,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "HTTP-Referer": "http://localhost:8080",
-                        "X-Title": "Housing OCR",
-                    },
                 )
                 print(f"{doc_tag} 收到响应，状态码: {response.status_code}")
                 response.raise_for_status()
@@ -213,7 +218,7 @@ Incorrect output (DO NOT do this):
                 properties = _convert_era_in_properties(properties)
 
                 print(f"{doc_tag} 模型 {model} 返回:")
-                print(f"  {json.dumps(properties, ensure_ascii=False, indent=2)}")
+                print(f"  {orjson.dumps(properties, option=orjson.OPT_INDENT_2).decode()}")
 
                 meaningful_count = sum(
                     1
@@ -259,8 +264,6 @@ Incorrect output (DO NOT do this):
                 continue
             except Exception as e:
                 print(f"{doc_tag} 模型 {model} 提取失败: {str(e)}")
-                import traceback
-
                 traceback.print_exc()
                 self.model_cooldown_times[model] = time.time()
                 print(
@@ -1,147 +1,250 @@
+import json
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, Dict, Any
-import json
+from typing import Optional, Dict, Any, Iterator, List
+import orjson
+
+# Columns added to `documents` after the initial schema, in migration order.
+# New databases get them from CREATE TABLE; older ones via ALTER TABLE.
+DOCUMENT_MIGRATION_COLUMNS = [
+    ("favorite", "INTEGER DEFAULT 0"),
+    ("extracted_model", "TEXT"),
+    ("image_width", "INTEGER"),
+    ("image_height", "INTEGER"),
+    ("file_hash", "TEXT"),
+    ("auto_llm", "INTEGER"),
+    ("original_filename", "TEXT"),
+    ("sort_order", "INTEGER DEFAULT 0"),
+    ("next_retry_at", "INTEGER DEFAULT 0"),
+]
+
+# Stored in PRAGMA user_version; bump whenever _init_db gains a migration step.
+SCHEMA_VERSION = 7
+# Hex length of the MD5 file hashes stored before uploads switched to BLAKE2b
+LEGACY_FILE_HASH_LENGTH = 32
+
+# Documents the processor still has to pick up; shared by the query and its partial index.
+# OCR 'failed' means its retries are exhausted: only a manual retry puts it back to pending.
+PENDING_DOCUMENTS_WHERE = (
+    "(ocr_status IN ('pending', 'processing') "
+    "OR (ocr_status = 'done' AND llm_status IN ('pending', 'processing', 'failed')))"
+)
+# Each stage is retried automatically this many times (retry_count resets when OCR
+# succeeds and on manual retries); after that only a manual retry requeues the document
+MAX_AUTO_RETRIES = 3
+# Delay before the first automatic retry, doubled for each further one (1 min, then 2 min),
+# so a short OCR/LLM outage does not use up the whole retry budget within milliseconds
+RETRY_BACKOFF_SECONDS = 60
 
 
 class Database:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool_size: int = 4):
         self.db_path = db_path
+        # LIFO：低并发时总是复用最近归还的连接，其页缓存 (cache_size) 仍是热的
+        self._pool: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue(maxsize=pool_size)
+        # 保护 _closed 与归还/清空连接池之间的竞争
+        self._pool_lock = threading.Lock()
+        self._closed = False
+        for _ in range(pool_size):
+            self._pool.put(self._get_connection())
         self._init_db()
 
     def _get_connection(self):
-        conn = sqlite3.connect(self.db_path)
+        # 处理器与接口共用连接池写入，等待写锁的时间放宽到30秒，避免偶发的 database is locked
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-64000")
+        conn.execute("PRAGMA mmap_size=268435456")
+        # 排序用的临时 B 树放在内存中
+        conn.execute("PRAGMA temp_store=MEMORY")
         return conn
 
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a pooled connection; commit on success, roll back on error."""
+        while True:
+            # 关闭后不再无限等待已被清空的连接池
+            if self._closed:
+                raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+            try:
+                conn = self._pool.get(timeout=1)
+                break
+            except queue.Empty:
+                continue
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            with self._pool_lock:
+                if self._closed:
+                    conn.close()
+                else:
+                    self._pool.put(conn)
+
+    def close(self):
+        """Close all pooled connections; borrowed ones are closed when returned."""
+        with self._pool_lock:
+            self._closed = True
+            while not self._pool.empty():
+                self._pool.get_nowait().close()
+
+    def _dump_properties(self, properties: dict) -> str:
+        """Serialize properties to JSON text."""
+        try:
+            return orjson.dumps(properties).decode()
+        except TypeError:
+            # orjson 不支持超出 64 位的整数等，回退到标准库
+            return json.dumps(properties, ensure_ascii=False)
+
     def _parse_properties(self, doc: dict) -> dict:
         """Parse JSON properties field from document."""
         if doc.get("properties") and doc["properties"].strip():
             try:
-                doc["properties"] = json.loads(doc["properties"])
-            except (json.JSONDecodeError, TypeError):
+                doc["properties"] = orjson.loads(doc["properties"])
+            except orjson.JSONDecodeError:
                 doc["properties"] = {}
         else:
             doc["properties"] = {}
         return doc
 
     def _init_db(self):
-        conn = self._get_connection()
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS documents (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                filename TEXT NOT NULL,
-                upload_time TEXT NOT NULL,
-                ocr_status TEXT DEFAULT 'pending',
-                ocr_text TEXT,
-                llm_status TEXT DEFAULT 'pending',
-                properties TEXT,
-                retry_count INTEGER DEFAULT 0,
-                favorite INTEGER DEFAULT 0,
-                extracted_model TEXT,
-                image_width INTEGER,
-                image_height INTEGER,
-                file_hash TEXT
-            )
-        """)
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS locations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                display_order INTEGER DEFAULT 0,
-                show_in_tag INTEGER DEFAULT 0
+        with self._connection() as conn:
+            # 已是最新 schema 的数据库直接跳过迁移
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    filename TEXT NOT NULL,
+                    upload_time TEXT NOT NULL,
+                    ocr_status TEXT DEFAULT 'pending',
+                    ocr_text TEXT,
+                    llm_status TEXT DEFAULT 'pending',
+                    properties TEXT,
+                    retry_count INTEGER DEFAULT 0,
+                    favorite INTEGER DEFAULT 0,
+                    extracted_model TEXT,
+                    image_width INTEGER,
+                    image_height INTEGER,
+                    file_hash TEXT,
+                    auto_llm INTEGER,
+                    original_filename TEXT,
+                    sort_order INTEGER DEFAULT 0,
+                    next_retry_at INTEGER DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS locations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    display_order INTEGER DEFAULT 0,
+                    show_in_tag INTEGER DEFAULT 0
+                )
+            """)
+            # Legacy table name: rename it, or drop it if travel_times already exists
+            tables = {
+                row["name"]
+                for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('station_durations', 'travel_times')"
+                )
+            }
+            if "station_durations" in tables:
+                if "travel_times" in tables:
+                    conn.execute("DROP TABLE station_durations")
+                else:
+                    conn.execute("ALTER TABLE station_durations RENAME TO travel_times")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS travel_times (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    station_name TEXT NOT NULL,
+                    location_id INTEGER NOT NULL,
+                    duration INTEGER NOT NULL,
+                    UNIQUE(station_name, location_id),
+                    FOREIGN KEY(location_id) REFERENCES locations(id) ON DELETE CASCADE
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_travel_times_location_id ON travel_times(location_id)"
             )
-        """)
-        try:
-            conn.execute("ALTER TABLE station_durations RENAME TO travel_times")
-            conn.commit()
-        except sqlite3.OperationalError:
-            pass
-        finally:
-            conn.execute("DROP TABLE IF EXISTS station_durations")
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS travel_times (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                station_name TEXT NOT NULL,
-                location_id INTEGER NOT NULL,
-                duration INTEGER NOT NULL,
-                UNIQUE(station_name, location_id),
-                FOREIGN KEY(location_id) REFERENCES locations(id) ON DELETE CASCADE
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_travel_times_station_name ON travel_times(station_name)"
             )
-        """)
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_travel_times_location_id ON travel_times(location_id)"
-        )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_travel_times_station_name ON travel_times(station_name)"
-        )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_travel_times_composite ON travel_times(station_name, location_id)"
-        )
-        conn.commit()
-        try:
-            conn.execute("ALTER TABLE documents ADD COLUMN favorite INTEGER DEFAULT 0")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            conn.execute("ALTER TABLE documents ADD COLUMN extracted_model TEXT")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            conn.execute("ALTER TABLE documents ADD COLUMN image_width INTEGER")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            conn.execute("ALTER TABLE documents ADD COLUMN image_height INTEGER")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            conn.execute("ALTER TABLE documents ADD COLUMN file_hash TEXT")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            conn.execute("ALTER TABLE documents ADD COLUMN auto_llm INTEGER")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            conn.execute("ALTER TABLE documents ADD COLUMN original_filename TEXT")
-        except sqlite3.OperationalError:
-            pass
-        try:
             conn.execute(
-                "ALTER TABLE documents ADD COLUMN sort_order INTEGER DEFAULT 0"
+                "CREATE INDEX IF NOT EXISTS idx_travel_times_composite ON travel_times(station_name, location_id)"
+            )
+            conn.commit()
+            # Only ask SQLite about the columns we migrate
+            columns = [column for column, _ in DOCUMENT_MIGRATION_COLUMNS]
+            placeholders = ", ".join("?" * len(columns))
+            existing_columns = {
+                row["name"]
+                for row in conn.execute(
+                    f"SELECT name FROM pragma_table_info('documents') WHERE name IN ({placeholders})",
+                    columns,
+                )
+            }
+            statements = [
+                f"ALTER TABLE documents ADD COLUMN {column} {definition}"
+                for column, definition in DOCUMENT_MIGRATION_COLUMNS
+                if column not in existing_columns
+            ]
+            statements += [
+                "CREATE INDEX IF NOT EXISTS idx_documents_file_hash ON documents(file_hash)",
+                # Documents still carrying an MD5 hash; empty once they have all been rehashed,
+                # so the startup check is an index probe instead of a full table scan
+                f"CREATE INDEX IF NOT EXISTS idx_documents_legacy_file_hash ON documents(id) WHERE length(file_hash) = {LEGACY_FILE_HASH_LENGTH}",
+                # Documents that already went through LLM extraction (used by bulk resets)
+                "CREATE INDEX IF NOT EXISTS idx_documents_llm_status_active ON documents(llm_status) WHERE llm_status IN ('done', 'processing', 'failed')",
+                # Pending work in processor order, so the queue poll skips finished documents.
+                # Rebuilt so its predicate matches PENDING_DOCUMENTS_WHERE exactly.
+                "DROP INDEX IF EXISTS idx_documents_pending",
+                f"CREATE INDEX IF NOT EXISTS idx_documents_pending ON documents(upload_time) WHERE {PENDING_DOCUMENTS_WHERE}",
+                # Migrate existing documents: set sort_order to upload_time timestamp
+                "UPDATE documents SET sort_order = CAST((julianday(upload_time) - 2440587.5) * 86400000 AS INTEGER) WHERE sort_order = 0",
+                # Older versions never capped retry_count; give unfinished documents a fresh
+                # retry budget so they do not silently drop out of the queue after upgrading
+                "UPDATE documents SET retry_count = 0 WHERE retry_count IS NULL "
+                "OR (retry_count != 0 AND (ocr_status != 'done' OR llm_status != 'done'))",
+                f"PRAGMA user_version = {SCHEMA_VERSION}",
+            ]
+            # Run every migration in one script under a single write lock:
+            # one round-trip, one schema reload and one commit/fsync.
+            # Refresh planner statistics afterwards since the schema changed.
+            conn.executescript(
+                "BEGIN IMMEDIATE;\n"
+                + ";\n".join(statements)
+                + ";\nCOMMIT;\nANALYZE documents;\nPRAGMA optimize;"
             )
-        except sqlite3.OperationalError:
-            pass
-        # Migrate existing documents: set sort_order to upload_time timestamp
-        conn.execute(
-            "UPDATE documents SET sort_order = CAST((julianday(upload_time) - 2440587.5) * 86400000 AS INTEGER) WHERE sort_order = 0"
-        )
-        conn.commit()
-        conn.close()
-
-    def create_document(self, filename: str, original_filename: str = None) -> int:
-        import time
 
-        conn = self._get_connection()
-        cursor = conn.cursor()
+    def create_document(
+        self, filename: str, original_filename: str = None, file_hash: Optional[str] = None
+    ) -> int:
         now = datetime.now().isoformat()
         sort_order = int(time.time() * 1000)
-        cursor.execute(
-            "INSERT INTO documents (filename, original_filename, upload_time, auto_llm, sort_order) VALUES (?, ?, ?, ?, ?)",
-            (filename, original_filename, now, 1, sort_order),
-        )
-        doc_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return doc_id
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO documents (filename, original_filename, upload_time, auto_llm, sort_order, file_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (filename, original_filename, now, 1, sort_order, file_hash),
+            )
+            return cursor.lastrowid
 
     def get_document(self, doc_id: int) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM documents WHERE id = ?", (doc_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
         if row:
             doc = self._parse_properties(dict(row))
             doc["travel_times"] = self.get_doc_travel_times(doc_id)
@@ -149,12 +252,18 @@ class Database:
             return doc
         return None
 
+    def get_document_filename(self, doc_id: int) -> Optional[str]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT filename FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+        return row["filename"] if row else None
+
     def get_document_by_filename(self, filename: str) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM documents WHERE filename = ?", (filename,))
-        row = cursor.fetchone()
-        conn.close()
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM documents WHERE filename = ?", (filename,)
+            ).fetchone()
         if row:
             doc = self._parse_properties(dict(row))
             doc["display_filename"] = doc.get("original_filename") or doc["filename"]
@@ -162,15 +271,16 @@ class Database:
         return None
 
     def get_all_documents(self) -> list:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM documents ORDER BY sort_order ASC")
-        rows = cursor.fetchall()
-        conn.close()
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT * FROM documents ORDER BY sort_order ASC"
+            ).fetchall()
+            # 一次查出全部通勤时间，避免每个文档再按车站逐个查询
+            by_station = self._travel_times_by_station(conn)
         docs = []
         for row in rows:
             doc = self._parse_properties(dict(row))
-            doc["travel_times"] = self.get_doc_travel_times(doc["id"])
+            doc["travel_times"] = self._station_travel_times(doc["properties"], by_station)
             doc["display_filename"] = doc.get("original_filename") or doc["filename"]
             docs.append(doc)
         return docs
@@ -178,18 +288,18 @@ class Database:
     def update_ocr_status(
         self, doc_id: int, status: str, ocr_text: Optional[str] = None
     ):
-        conn = self._get_connection()
-        if ocr_text is not None:
-            conn.execute(
-                "UPDATE documents SET ocr_status = ?, ocr_text = ? WHERE id = ?",
-                (status, ocr_text, doc_id),
-            )
-        else:
-            conn.execute(
-                "UPDATE documents SET ocr_status = ? WHERE id = ?", (status, doc_id)
-            )
-        conn.commit()
-        conn.close()
+        with self._connection() as conn:
+            if ocr_text is not None:
+                # OCR 成功后 LLM 阶段重新计算重试次数
+                conn.execute(
+                    "UPDATE documents SET ocr_status = ?, ocr_text = ?, "
+                    "retry_count = CASE WHEN ? = 'done' THEN 0 ELSE retry_count END WHERE id = ?",
+                    (status, ocr_text, status, doc_id),
+                )
+            else:
+                conn.execute(
+                    "UPDATE documents SET ocr_status = ? WHERE id = ?", (status, doc_id)
+                )
 
     def update_llm_status(
         self,
@@ -198,158 +308,187 @@ class Database:
         properties: Optional[dict] = None,
         extracted_model: str = None,
     ):
-        conn = self._get_connection()
-        if properties is not None:
+        with self._connection() as conn:
+            if properties is not None:
+                conn.execute(
+                    "UPDATE documents SET llm_status = ?, properties = ?, extracted_model = ? WHERE id = ?",
+                    (
+                        status,
+                        self._dump_properties(properties),
+                        extracted_model,
+                        doc_id,
+                    ),
+                )
+            else:
+                conn.execute(
+                    "UPDATE documents SET llm_status = ?, extracted_model = ? WHERE id = ?",
+                    (status, extracted_model, doc_id),
+                )
+
+    def record_failed_attempt(self, doc_id: int):
+        """Count a failed processing attempt and release its 'processing' state.
+
+        Unfinished OCR goes back to pending, or to failed once MAX_AUTO_RETRIES
+        attempts are used up; otherwise LLM stuck in processing is marked
+        failed. The next automatic retry waits RETRY_BACKOFF_SECONDS, doubled
+        per earlier attempt. SET expressions see the pre-update row.
+        """
+        now_ms = int(time.time() * 1000)
+        with self._connection() as conn:
             conn.execute(
-                "UPDATE documents SET llm_status = ?, properties = ?, extracted_model = ? WHERE id = ?",
-                (
-                    status,
-                    json.dumps(properties, ensure_ascii=False),
-                    extracted_model,
-                    doc_id,
-                ),
+                """
+                UPDATE documents SET
+                    retry_count = retry_count + 1,
+                    next_retry_at = ? + ? * (1 << retry_count),
+                    ocr_status = CASE
+                        WHEN ocr_status NOT IN ('processing', 'pending') THEN ocr_status
+                        WHEN retry_count + 1 >= ? THEN 'failed'
+                        ELSE 'pending'
+                    END,
+                    llm_status = CASE
+                        WHEN ocr_status != 'processing' AND llm_status = 'processing' THEN 'failed'
+                        ELSE llm_status
+                    END
+                WHERE id = ?
+                """,
+                (now_ms, RETRY_BACKOFF_SECONDS * 1000, MAX_AUTO_RETRIES, doc_id),
             )
-        else:
-            conn.execute(
-                "UPDATE documents SET llm_status = ?, extracted_model = ? WHERE id = ?",
-                (status, extracted_model, doc_id),
-            )
-        conn.commit()
-        conn.close()
-
-    def increment_retry(self, doc_id: int):
-        conn = self._get_connection()
-        conn.execute(
-            "UPDATE documents SET retry_count = retry_count + 1 WHERE id = ?", (doc_id,)
-        )
-        conn.commit()
-        conn.close()
 
     def get_pending_documents(self) -> list:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT * FROM documents WHERE (ocr_status = 'pending' OR ocr_status = 'processing' OR ocr_status = 'failed' "
-            "OR (ocr_status = 'done' AND (llm_status = 'pending' OR llm_status = 'processing' OR llm_status = 'failed'))) "
-            "ORDER BY upload_time DESC LIMIT 10"
-        )
-        rows = cursor.fetchall()
-        conn.close()
+        """Return id/filename/original_filename of up to 10 documents awaiting processing."""
+        # 只取调度所需的列，避免每次轮询都读出 ocr_text 等大字段
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT id, filename, original_filename FROM documents "
+                f"WHERE {PENDING_DOCUMENTS_WHERE} "
+                "AND retry_count < ? AND next_retry_at <= ? "
+                "ORDER BY upload_time DESC LIMIT 10",
+                (MAX_AUTO_RETRIES, int(time.time() * 1000)),
+            ).fetchall()
         return [dict(row) for row in rows]
 
     def toggle_favorite(self, doc_id: int) -> int:
-        import time
-
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT favorite FROM documents WHERE id = ?", (doc_id,))
-        row = cursor.fetchone()
-        if row:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT favorite FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+            if not row:
+                return 0
             new_favorite = 1 if row["favorite"] == 0 else 0
             # Set sort_order to current time for both favorite and unfavorite
             conn.execute(
                 "UPDATE documents SET favorite = ?, sort_order = ? WHERE id = ?",
                 (new_favorite, int(time.time() * 1000), doc_id),
             )
-            conn.commit()
-            conn.close()
             return new_favorite
-        conn.close()
-        return 0
-
-    def delete_document(self, doc_id: int, file_path: str = None):
-        from pathlib import Path
-
-        conn = self._get_connection()
-        conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
-        conn.commit()
-        conn.close()
 
-        if file_path:
-            try:
-                Path(file_path).unlink(missing_ok=True)
-            except Exception:
-                pass
-
-    def reset_llm_status(self, doc_id: int):
-        conn = self._get_connection()
-        conn.execute(
-            "UPDATE documents SET llm_status = 'pending', properties = NULL WHERE id = ?",
-            (doc_id,),
-        )
-        conn.commit()
-        conn.close()
+    def delete_document(self, doc_id: int) -> Optional[str]:
+        """Delete a document row and return its filename (None if it did not exist)."""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT filename FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+        return row["filename"] if row else None
+
+    def delete_unfavorited_documents(self) -> List[str]:
+        """Delete every non-favorite document in one transaction and return their filenames."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT filename FROM documents WHERE favorite IS NOT 1"
+            ).fetchall()
+            conn.execute("DELETE FROM documents WHERE favorite IS NOT 1")
+        return [row["filename"] for row in rows]
+
+    def reset_llm_status(self, doc_id: int) -> bool:
+        with self._connection() as conn:
+            # LLM 需要 OCR 文本：OCR 已放弃重试时一并重新排队
+            cursor = conn.execute(
+                "UPDATE documents SET llm_status = 'pending', properties = NULL, "
+                "retry_count = 0, next_retry_at = 0, "
+                "ocr_status = CASE WHEN ocr_status = 'failed' THEN 'pending' ELSE ocr_status END "
+                "WHERE id = ?",
+                (doc_id,),
+            )
+            return cursor.rowcount > 0
 
     def retry_all_failed_llm(self) -> int:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE documents SET llm_status = 'pending' WHERE ocr_status = 'done' AND llm_status = 'failed'"
-        )
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
-        return affected
-
-    def reset_ocr_status(self, doc_id: int):
-        conn = self._get_connection()
-        conn.execute(
-            "UPDATE documents SET ocr_status = 'pending', ocr_text = NULL WHERE id = ?",
-            (doc_id,),
-        )
-        conn.commit()
-        conn.close()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "UPDATE documents SET llm_status = 'pending', retry_count = 0, next_retry_at = 0 "
+                "WHERE ocr_status = 'done' AND llm_status = 'failed'"
+            )
+            return cursor.rowcount
+
+    def reset_ocr_status(self, doc_id: int) -> bool:
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "UPDATE documents SET ocr_status = 'pending', ocr_text = NULL, retry_count = 0, next_retry_at = 0 WHERE id = ?",
+                (doc_id,),
+            )
+            return cursor.rowcount > 0
 
     def update_image_dimensions(self, doc_id: int, width: int, height: int):
-        conn = self._get_connection()
-        conn.execute(
-            "UPDATE documents SET image_width = ?, image_height = ? WHERE id = ?",
-            (width, height, doc_id),
-        )
-        conn.commit()
-        conn.close()
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE documents SET image_width = ?, image_height = ? WHERE id = ?",
+                (width, height, doc_id),
+            )
 
     def update_file_hash(self, doc_id: int, file_hash: str):
-        conn = self._get_connection()
-        conn.execute(
-            "UPDATE documents SET file_hash = ? WHERE id = ?",
-            (file_hash, doc_id),
-        )
-        conn.commit()
-        conn.close()
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE documents SET file_hash = ? WHERE id = ?",
+                (file_hash, doc_id),
+            )
 
     def get_document_by_hash(self, file_hash: str) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM documents WHERE file_hash = ?", (file_hash,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            doc = self._parse_properties(dict(row))
-            doc["travel_times"] = self.get_doc_travel_times(doc["id"])
-            return doc
-        return None
+        """Return id/filename/original_filename of the document with this content hash."""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT id, filename, original_filename FROM documents WHERE file_hash = ? LIMIT 1",
+                (file_hash,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def has_legacy_file_hashes(self) -> bool:
+        """Return whether any document still carries an MD5 file hash."""
+        with self._connection() as conn:
+            # 规划器会改用覆盖索引 idx_documents_file_hash 全扫描，这里固定使用部分索引
+            row = conn.execute(
+                "SELECT 1 FROM documents INDEXED BY idx_documents_legacy_file_hash "
+                f"WHERE length(file_hash) = {LEGACY_FILE_HASH_LENGTH} LIMIT 1"
+            ).fetchone()
+        return row is not None
+
+    def get_legacy_hash_documents(self) -> list:
+        """Return id/filename of documents that still carry an MD5 file hash."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT id, filename FROM documents INDEXED BY idx_documents_legacy_file_hash "
+                f"WHERE length(file_hash) = {LEGACY_FILE_HASH_LENGTH}"
+            ).fetchall()
+        return [dict(row) for row in rows]
 
     def get_all_locations(self) -> list:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM locations ORDER BY display_order, id")
-        rows = cursor.fetchall()
-        conn.close()
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT * FROM locations ORDER BY display_order, id"
+            ).fetchall()
         return [dict(row) for row in rows]
 
     def add_location(self, name: str) -> Dict[str, Any]:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO locations (name, display_order) VALUES (?, COALESCE((SELECT MAX(display_order) + 1 FROM locations), 1))",
-            (name,),
-        )
-        location_id = cursor.lastrowid
-        conn.commit()
-        cursor.execute("SELECT * FROM locations WHERE id = ?", (location_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO locations (name, display_order) VALUES (?, COALESCE((SELECT MAX(display_order) + 1 FROM locations), 1))",
+                (name,),
+            )
+            location_id = cursor.lastrowid
+            conn.commit()
+            row = conn.execute(
+                "SELECT * FROM locations WHERE id = ?", (location_id,)
+            ).fetchone()
         return (
             dict(row)
             if row
@@ -357,104 +496,128 @@ class Database:
         )
 
     def delete_location(self, location_id: int):
-        conn = self._get_connection()
-        conn.execute("DELETE FROM locations WHERE id = ?", (location_id,))
-        conn.execute("DELETE FROM travel_times WHERE location_id = ?", (location_id,))
-        conn.commit()
-        conn.close()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM locations WHERE id = ?", (location_id,))
+            conn.execute(
+                "DELETE FROM travel_times WHERE location_id = ?", (location_id,)
+            )
 
     def update_location_display(self, location_id: int, show_in_tag: int):
-        conn = self._get_connection()
-        conn.execute(
-            "UPDATE locations SET show_in_tag = ? WHERE id = ?",
-            (show_in_tag, location_id),
-        )
-        conn.commit()
-        conn.close()
-
-    def reorder_locations(self, location_ids: list):
-        conn = self._get_connection()
-        for i, location_id in enumerate(location_ids):
+        with self._connection() as conn:
             conn.execute(
-                "UPDATE locations SET display_order = ? WHERE id = ?",
-                (i + 1, location_id),
+                "UPDATE locations SET show_in_tag = ? WHERE id = ?",
+                (show_in_tag, location_id),
             )
-        conn.commit()
-        conn.close()
+
+    def reorder_locations(self, location_ids: list):
+        with self._connection() as conn:
+            for i, location_id in enumerate(location_ids):
+                conn.execute(
+                    "UPDATE locations SET display_order = ? WHERE id = ?",
+                    (i + 1, location_id),
+                )
 
     def get_travel_times_for_station(self, station_name: str) -> list:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT sd.*, l.name as location_name, l.show_in_tag
-            FROM travel_times sd
-            JOIN locations l ON sd.location_id = l.id
-            WHERE sd.station_name = ?
-            ORDER BY l.display_order, l.id
-        """,
-            (station_name,),
-        )
-        rows = cursor.fetchall()
-        conn.close()
+        with self._connection() as conn:
+            rows = conn.execute(
+                """
+                SELECT sd.*, l.name as location_name, l.show_in_tag
+                FROM travel_times sd
+                JOIN locations l ON sd.location_id = l.id
+                WHERE sd.station_name = ?
+                ORDER BY l.display_order, l.id
+            """,
+                (station_name,),
+            ).fetchall()
         return [dict(row) for row in rows]
 
     def get_all_travel_times(self) -> list:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT sd.*, l.name as location_name, l.show_in_tag
-            FROM travel_times sd
-            JOIN locations l ON sd.location_id = l.id
-            ORDER BY sd.station_name, l.display_order, l.id
-        """)
-        rows = cursor.fetchall()
-        conn.close()
+        with self._connection() as conn:
+            rows = conn.execute("""
+                SELECT sd.*, l.name as location_name, l.show_in_tag
+                FROM travel_times sd
+                JOIN locations l ON sd.location_id = l.id
+                ORDER BY sd.station_name, l.display_order, l.id
+            """).fetchall()
         return [dict(row) for row in rows]
 
     def set_travel_time(self, station_name: str, location_id: int, duration: int):
-        conn = self._get_connection()
-        conn.execute(
-            """
-            INSERT OR REPLACE INTO travel_times (station_name, location_id, duration)
-            VALUES (?, ?, ?)
-        """,
-            (station_name, location_id, duration),
-        )
-        conn.commit()
-        conn.close()
+        self.set_travel_times([(station_name, location_id, duration)])
+
+    def set_travel_times(self, travel_times: list):
+        """Upsert many (station_name, location_id, duration) rows in one transaction."""
+        with self._connection() as conn:
+            # ON CONFLICT updates the row in place; INSERT OR REPLACE would
+            # delete and re-insert it, rewriting every index entry
+            conn.executemany(
+                """
+                INSERT INTO travel_times (station_name, location_id, duration)
+                VALUES (?, ?, ?)
+                ON CONFLICT(station_name, location_id) DO UPDATE SET duration = excluded.duration
+            """,
+                travel_times,
+            )
 
     def delete_travel_time(self, station_name: str, location_id: int):
-        conn = self._get_connection()
-        conn.execute(
-            "DELETE FROM travel_times WHERE station_name = ? AND location_id = ?",
-            (station_name, location_id),
-        )
-        conn.commit()
-        conn.close()
+        with self._connection() as conn:
+            conn.execute(
+                "DELETE FROM travel_times WHERE station_name = ? AND location_id = ?",
+                (station_name, location_id),
+            )
+
+    def _travel_times_by_station(
+        self, conn: sqlite3.Connection, station_names: Optional[List[str]] = None
+    ) -> Dict[str, list]:
+        """Load travel times (with location info) grouped by station name."""
+        query = """
+            SELECT sd.*, l.name as location_name, l.show_in_tag
+            FROM travel_times sd
+            JOIN locations l ON sd.location_id = l.id
+        """
+        params: list = []
+        if station_names is not None:
+            if not station_names:
+                return {}
+            query += f" WHERE sd.station_name IN ({','.join('?' * len(station_names))})"
+            params = station_names
+        query += " ORDER BY l.display_order, l.id"
+        by_station: Dict[str, list] = {}
+        for row in conn.execute(query, params):
+            by_station.setdefault(row["station_name"], []).append(dict(row))
+        return by_station
+
+    @staticmethod
+    def _station_names(properties: Any) -> List[str]:
+        """Return the non-empty station names listed in a document's properties."""
+        stations = properties.get("stations") if isinstance(properties, dict) else None
+        if not stations or not isinstance(stations, list):
+            return []
+        names = []
+        for station in stations:
+            name = station.get("name") if isinstance(station, dict) else None
+            if name and isinstance(name, str) and name.strip():
+                names.append(name)
+        return names
+
+    @classmethod
+    def _station_travel_times(cls, properties: Any, by_station: Dict[str, list]) -> list:
+        """Concatenate travel times for each listed station, in listing order."""
+        all_durations = []
+        for name in cls._station_names(properties):
+            all_durations.extend(by_station.get(name, []))
+        return all_durations
 
     def get_doc_travel_times(self, doc_id: int) -> list:
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT properties FROM documents WHERE id = ?", (doc_id,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT properties FROM documents WHERE id = ?", (doc_id,)
+            ).fetchone()
+            if not row:
+                return []
             try:
-                props = json.loads(row["properties"])
-                stations = props.get("stations", [])
-                if stations and isinstance(stations, list):
-                    all_durations = []
-                    for station in stations:
-                        station_name = station.get("name")
-                        if (
-                            station_name
-                            and isinstance(station_name, str)
-                            and station_name.strip()
-                        ):
-                            durations = self.get_travel_times_for_station(station_name)
-                            all_durations.extend(durations)
-                    return all_durations
-            except (json.JSONDecodeError, TypeError, KeyError):
-                pass
-        return []
+                props = orjson.loads(row["properties"])
+            except orjson.JSONDecodeError:
+                return []
+            names = self._station_names(props)
+            by_station = self._travel_times_by_station(conn, list(set(names)))
+        return self._station_travel_times(props, by_station)
@@ -3,7 +3,9 @@ import httpx
 import base64
 import fitz
 import asyncio
-from typing import List
+import orjson
+from io import BytesIO
+from typing import AsyncIterator, List
 
 
 class OCRClient:
@@ -13,6 +15,8 @@ class OCRClient:
         self._client: httpx.AsyncClient | None = None
         self.max_image_size = 1400
         self.pdf_dpi = 200
+        # 多页PDF同时在途的OCR请求数 (vLLM 会合并批处理)
+        self.max_concurrent_pages = 4
 
     async def _get_client(self) -> httpx.AsyncClient:
         if self._client is None:
@@ -20,32 +24,43 @@ class OCRClient:
         return self._client
 
     def _resize_image(self, image: Image.Image) -> Image.Image:
-        """Resize image to ensure it doesn't exceed maximum size."""
-        width, height = image.size
-        if width <= self.max_image_size and height <= self.max_image_size:
-            return image
-
-        ratio = min(self.max_image_size / width, self.max_image_size / height)
-        new_width = int(width * ratio)
-        new_height = int(height * ratio)
-        return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-    def _pdf_to_images(self, pdf_path: str, dpi: int = 200) -> List[Image.Image]:
-        images = []
-        with fitz.open(pdf_path) as doc:
-            for page in doc:
-                mat = fitz.Matrix(dpi / 72, dpi / 72)
-                pm = page.get_pixmap(matrix=mat, alpha=False)
-                image = Image.frombytes("RGB", (pm.width, pm.height), pm.samples)
-                image = self._resize_image(image)
-                images.append(image.copy())
-        return images
+        """Shrink image in place so it doesn't exceed maximum size."""
+        image.thumbnail(
+            (self.max_image_size, self.max_image_size),
+            Image.Resampling.LANCZOS,
+            reducing_gap=3.0,
+        )
+        return image
+
+    def _render_pdf_page(self, doc: fitz.Document, index: int) -> str:
+        """Render a page as base64 PNG, capped at max_image_size."""
+        page = doc[index]
+        # 直接按目标分辨率栅格化并由 MuPDF 编码PNG，省去 PIL 拷贝与缩放
+        zoom = min(
+            self.pdf_dpi / 72,
+            self.max_image_size / page.rect.width,
+            self.max_image_size / page.rect.height,
+        )
+        pm = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return base64.b64encode(pm.tobytes("png")).decode()
+
+    async def _iter_pdf_pages(self, pdf_path: str) -> AsyncIterator[str]:
+        """Render PDF pages one by one in a worker thread.
+
+        MuPDF documents must not be shared across threads, so pages are
+        rendered sequentially; the caller overlaps this with OCR requests.
+        """
+        doc = await asyncio.to_thread(fitz.open, pdf_path)
+        try:
+            for index in range(doc.page_count):
+                yield await asyncio.to_thread(self._render_pdf_page, doc, index)
+        finally:
+            doc.close()
 
     def _image_to_base64(self, image: Image.Image) -> str:
-        from io import BytesIO
-
         buffered = BytesIO()
-        image.save(buffered, format="PNG", optimize=True)
+        # 默认压缩级别即可：optimize 会多花约4倍编码时间，体积只小约5%
+        image.save(buffered, format="PNG")
         img_str = base64.b64encode(buffered.getvalue()).decode()
         return img_str
 
@@ -56,16 +71,13 @@ class OCRClient:
         file_path_lower = file_path.lower()
 
         if file_path_lower.endswith(".pdf"):
-            # PDF parsing is blocking - run in executor
-            loop = asyncio.get_event_loop()
-            images = await loop.run_in_executor(None, self._pdf_to_images, file_path)
-            if not images:
+            # 边渲染边提交OCR：下一页的栅格化与前面页面的OCR请求重叠
+            texts = await self._extract_pages(self._iter_pdf_pages(file_path))
+            if not texts:
                 raise Exception("PDF文件为空或无法读取")
-            all_text = []
-            for i, image in enumerate(images):
-                text = await self._extract_from_image(image)
-                if text:
-                    all_text.append(f"[Page {i + 1}]\n{text}")
+            all_text = [
+                f"[Page {i + 1}]\n{text}" for i, text in enumerate(texts) if text
+            ]
             result = "\n\n".join(all_text)
             print(f"{doc_tag} OCR完成 ({len(result)} 字符)")
             return result
@@ -79,6 +91,24 @@ class OCRClient:
             print(f"{doc_tag} OCR完成 ({len(result) if result else 0} 字符)")
             return result
 
+    async def _extract_pages(self, pages: AsyncIterator[str]) -> List[str]:
+        """OCR base64 pages concurrently as they arrive, returning texts in page order."""
+        semaphore = asyncio.Semaphore(self.max_concurrent_pages)
+
+        async def _extract_page(img_base64: str) -> str:
+            async with semaphore:
+                return await self._extract_from_base64(img_base64)
+
+        tasks = []
+        try:
+            async for img_base64 in pages:
+                tasks.append(asyncio.create_task(_extract_page(img_base64)))
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
     def _open_and_resize_image(self, file_path: str) -> Image.Image:
         with Image.open(file_path) as img:
             resized = self._resize_image(img)
@@ -86,7 +116,9 @@ class OCRClient:
             return resized.copy()
 
     async def _extract_from_image(self, image: Image.Image) -> str:
-        img_base64 = self._image_to_base64(image)
+        return await self._extract_from_base64(self._image_to_base64(image))
+
+    async def _extract_from_base64(self, img_base64: str) -> str:
         prompt = """Please output layout information from PDF image, including each layout element's category, and corresponding text content within. IMPORTANT: Extract ALL text content from image, including headers, titles, small text, and any other text near edges of document.
 
 1. Layout Categories: The possible categories are ['Caption', 'Footnote', 'List-item', 'Page-footer', 'Page-header', 'Title', 'Table', 'Text'].
@@ -122,11 +154,14 @@ class OCRClient:
 
         client = await self._get_client()
         try:
+            # 载荷中含整页图片的base64，用 orjson 直接序列化为 bytes
             response = await client.post(
-                f"{self.endpoint}/chat/completions", json=payload
+                f"{self.endpoint}/chat/completions",
+                content=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"},
             )
             response.raise_for_status()
-            result = response.json()
+            result = orjson.loads(response.content)
             return result["choices"][0]["message"]["content"]
         except Exception as e:
             raise Exception(f"OCR请求失败: {str(e)}")
@@ -0,0 +1,84 @@
+"""Preview rendering.
+
+This module has no app-level side effects so the renderers can run in
+worker processes.
+"""
+
+import io
+from pathlib import Path
+from typing import BinaryIO, Callable
+
+import fitz
+from PIL import Image
+
+THUMBNAIL_WIDTH = 300
+THUMBNAIL_FAST_WIDTH = 256
+PREVIEW_MAX_SIZE = 1400
+
+
+def render_thumbnail(
+    file_path: Path,
+    out: BinaryIO,
+    max_width: int = THUMBNAIL_WIDTH,
+    resample: Image.Resampling = Image.Resampling.LANCZOS,
+):
+    """生成缩略图 (默认宽度300px，保持宽高比)，以JPEG写入 out"""
+    if file_path.suffix.lower() == ".pdf":
+        with fitz.open(file_path) as doc_obj:
+            page = doc_obj[0]
+            # 直接按目标宽度栅格化，避免先渲染大图再缩小
+            scale = min(2.0, max_width / page.rect.width)
+            mat = fitz.Matrix(scale, scale)
+            pm = page.get_pixmap(matrix=mat, alpha=False)
+            # 已是目标尺寸，由 MuPDF 直接编码为JPEG，无需经过 PIL
+            out.write(pm.tobytes("jpeg", jpg_quality=85))
+            return
+
+    with Image.open(file_path) as opened_img:
+        # JPEG 在解码阶段按 DCT 缩放，减少解码的像素量；
+        # 保留2倍余量，让后续的重采样仍有足够的源像素
+        opened_img.draft("RGB", (max_width * 2, max_width * 2))
+        img = opened_img.copy()  # Copy the image to keep it after file closes
+
+    # 计算缩略图尺寸
+    ratio = max_width / img.width
+    new_height = int(img.height * ratio)
+
+    # 生成缩略图
+    img.thumbnail((max_width, new_height), resample, reducing_gap=3.0)
+
+    # 转换为JPEG (质量85，平衡质量和速度)
+    img.convert("RGB").save(out, format="JPEG", quality=85, optimize=True)
+
+
+def render_preview(
+    file_path: Path,
+    out: BinaryIO,
+    resample: Image.Resampling = Image.Resampling.LANCZOS,
+):
+    """生成预览大图 (最长边不超过1400px)，以JPEG写入 out"""
+    MAX_SIZE = PREVIEW_MAX_SIZE
+
+    if file_path.suffix.lower() == ".pdf":
+        with fitz.open(file_path) as doc_obj:
+            page = doc_obj[0]
+            # MuPDF 直接渲染到输出分辨率 (最多2倍)，无需再做 LANCZOS 缩放
+            scale = min(2.0, MAX_SIZE / page.rect.width, MAX_SIZE / page.rect.height)
+            mat = fitz.Matrix(scale, scale)
+            pm = page.get_pixmap(matrix=mat, alpha=False)
+            out.write(pm.tobytes("jpeg", jpg_quality=90))
+            return
+
+    with Image.open(file_path) as opened_img:
+        opened_img.draft("RGB", (MAX_SIZE, MAX_SIZE))
+        img = opened_img.copy()
+    img.thumbnail((MAX_SIZE, MAX_SIZE), resample, reducing_gap=3.0)
+
+    img.convert("RGB").save(out, format="JPEG", quality=90, optimize=True)
+
+
+def render_to_bytes(render: Callable[..., None], file_path: Path, **kwargs) -> bytes:
+    """Run a renderer into memory and return the encoded JPEG."""
+    buffer = io.BytesIO()
+    render(file_path, buffer, **kwargs)
+    return buffer.getvalue()
@@ -1,9 +1,12 @@
 import asyncio
+import copy
+import functools
+import traceback
 from pathlib import Path
+from src.config import save_config
 from src.models import Database
 from src.ocr import OCRClient
 from src.llm import AllModelsFailedError, LLMExtractor
-import tomli_w
 
 
 class DocumentProcessor:
@@ -12,15 +15,25 @@ class DocumentProcessor:
         self.db = db
         self.ocr_client = OCRClient(config["ocr"]["endpoint"], config["ocr"]["model"])
         self._shutdown_event = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self.idle_poll_seconds = 30
+        # 关闭时等待处理中文档的最长时间，超时后取消，下次启动时重新处理
+        self.shutdown_timeout_seconds = 10
         self.llm_timeout_seconds = float(
             config.get("llm", {}).get("timeout_seconds", 15)
         )
 
+        def _log_config_write_error(future: asyncio.Future):
+            if not future.cancelled() and future.exception() is not None:
+                print(f"Error saving config: {future.exception()}")
+
         def _update_models_callback(models):
             config["llm"]["models"] = list(models)
-            config_path = Path(__file__).resolve().parent.parent / "config.toml"
-            with open(config_path, "wb") as f:
-                tomli_w.dump(config, f)
+            # 在事件循环中被调用，文件写入交给线程池
+            future = asyncio.get_running_loop().run_in_executor(
+                None, save_config, copy.deepcopy(config)
+            )
+            future.add_done_callback(_log_config_write_error)
 
         callback = update_models_callback or _update_models_callback
 
@@ -32,16 +45,23 @@ class DocumentProcessor:
             request_timeout_seconds=self.llm_timeout_seconds,
         )
 
+    @functools.cached_property
+    def upload_dir(self) -> Path:
+        return Path(self.config["app"]["upload_dir"])
+
+    def notify(self):
+        """Wake the queue loop so newly queued work starts without waiting for the next poll."""
+        self._wakeup.set()
+
     def _get_display_filename(self, doc: dict) -> str:
         return doc.get("original_filename") or doc.get("filename", "unknown")
 
     async def process_document(self, doc_id: int):
-        doc = self.db.get_document(doc_id)
+        doc = await asyncio.to_thread(self.db.get_document, doc_id)
         if not doc:
             return
 
-        upload_dir = Path(self.config["app"]["upload_dir"])
-        image_path = upload_dir / doc["filename"]
+        image_path = self.upload_dir / doc["filename"]
 
         try:
             print(
@@ -50,11 +70,11 @@ class DocumentProcessor:
             # Reset stuck processing states
             if doc["ocr_status"] == "processing":
                 print(f"[ID:{doc_id}] 检测到OCR处理中状态，重置为pending重试")
-                self.db.update_ocr_status(doc_id, "pending")
+                await asyncio.to_thread(self.db.update_ocr_status, doc_id, "pending")
                 doc["ocr_status"] = "pending"
             if doc["llm_status"] == "processing":
                 print(f"[ID:{doc_id}] 检测到LLM处理中状态，重置为pending重试")
-                self.db.update_llm_status(doc_id, "pending")
+                await asyncio.to_thread(self.db.update_llm_status, doc_id, "pending")
                 doc["llm_status"] = "pending"
 
             if doc["ocr_status"] in ["pending", "processing"]:
@@ -63,7 +83,7 @@ class DocumentProcessor:
                         f"[ID:{doc_id}] {self._get_display_filename(doc)} 开始OCR处理..."
                     )
                     print(f"[ID:{doc_id}] 文件路径: {image_path}")
-                    self.db.update_ocr_status(doc_id, "processing")
+                    await asyncio.to_thread(self.db.update_ocr_status, doc_id, "processing")
                 else:
                     print(
                         f"[ID:{doc_id}] {self._get_display_filename(doc)} 继续OCR处理..."
@@ -77,21 +97,21 @@ class DocumentProcessor:
                     print(f"[ID:{doc_id}] OCR API调用完成")
 
                     if not ocr_text or len(ocr_text.strip()) == 0:
-                        print(f"[ID:{doc_id}] OCR返回空文本，保持pending状态待重试")
-                        self.db.update_ocr_status(doc_id, "pending")
+                        print(f"[ID:{doc_id}] OCR返回空文本，计入重试次数待重试")
+                        await asyncio.to_thread(self.db.record_failed_attempt, doc_id)
                     else:
-                        self.db.update_ocr_status(doc_id, "done", ocr_text)
+                        await asyncio.to_thread(self.db.update_ocr_status, doc_id, "done", ocr_text)
                         print(f"[ID:{doc_id}] OCR完成 ({len(ocr_text)} 字符)")
                 except Exception as ocr_error:
                     print(f"[ID:{doc_id}] OCR调用失败: {str(ocr_error)}")
-                    self.db.update_ocr_status(doc_id, "pending")
+                    await asyncio.to_thread(self.db.update_ocr_status, doc_id, "pending")
                     raise ocr_error
 
             if doc["ocr_status"] == "done" and doc["llm_status"] in [
                 "pending",
                 "failed",
             ]:
-                current_doc = self.db.get_document(doc_id)
+                current_doc = await asyncio.to_thread(self.db.get_document, doc_id)
                 if not current_doc:
                     print(f"[ID:{doc_id}] 文档不存在，跳过")
                     return
@@ -100,14 +120,14 @@ class DocumentProcessor:
 
                 if not ocr_text or len(ocr_text.strip()) == 0:
                     print(f"[ID:{doc_id}] OCR文本为空，OCR状态重置为pending待重试")
-                    self.db.update_ocr_status(doc_id, "pending")
-                    self.db.update_llm_status(doc_id, "pending", None)
+                    await asyncio.to_thread(self.db.update_ocr_status, doc_id, "pending")
+                    await asyncio.to_thread(self.db.update_llm_status, doc_id, "pending", None)
                     return
 
                 print(
                     f"[ID:{doc_id}] {self._get_display_filename(current_doc)} 开始LLM提取..."
                 )
-                self.db.update_llm_status(doc_id, "processing")
+                await asyncio.to_thread(self.db.update_llm_status, doc_id, "processing")
                 print(f"[ID:{doc_id}] llm_status已更新为processing，准备调用LLM...")
 
                 try:
@@ -118,89 +138,95 @@ class DocumentProcessor:
                     print(
                         f"[ID:{doc_id}] 所有模型提取失败，标记为failed: {str(llm_error)}"
                     )
-                    self.db.update_llm_status(doc_id, "failed")
+                    # 计入重试次数并标记为 failed，自动重试达到上限后不再被轮询选中
+                    await asyncio.to_thread(self.db.record_failed_attempt, doc_id)
                     return
                 print(f"[ID:{doc_id}] LLM调用完成，开始更新数据库...")
                 extracted_model = properties.pop("_extracted_by_model", None)
-                self.db.update_llm_status(doc_id, "done", properties, extracted_model)
+                await asyncio.to_thread(self.db.update_llm_status, doc_id, "done", properties, extracted_model)
                 print(f"[ID:{doc_id}] LLM提取完成 (模型: {extracted_model})")
 
         except Exception as e:
-            import traceback
-
             print(f"[ID:{doc_id}] ==========================================")
             print(f"[ID:{doc_id}] 处理失败: {str(e)}")
             print(f"[ID:{doc_id}] 错误类型: {type(e).__name__}")
             traceback.print_exc()
             print(f"[ID:{doc_id}] ==========================================")
-            self.db.increment_retry(doc_id)
-
-            current_doc = self.db.get_document(doc_id)
-            if current_doc:
-                if current_doc["ocr_status"] == "processing":
-                    self.db.update_ocr_status(doc_id, "pending")
-                elif current_doc["llm_status"] == "processing":
-                    self.db.update_llm_status(doc_id, "failed")
+            await asyncio.to_thread(self.db.record_failed_attempt, doc_id)
 
     async def process_queue(self):
         print("后台处理器已启动...")
         print("开始监听待处理文档...")
-        max_concurrent = 3
+        max_concurrent = int(self.config.get("app", {}).get("parallel_docs", 3))
         semaphore = asyncio.Semaphore(max_concurrent)
-        active_tasks = set()
+        in_flight: dict[int, asyncio.Task] = {}
 
         async def process_with_semaphore(doc_id, filename):
             async with semaphore:
+                # 排队期间已开始关闭的任务不再处理新文档
+                if self._shutdown_event.is_set():
+                    return
                 print(f"[ID:{doc_id}] 开始处理: {filename}")
                 try:
                     await self.process_document(doc_id)
                     print(f"[ID:{doc_id}] 处理完成")
                 except Exception as e:
                     print(f"[ID:{doc_id}] 处理失败: {str(e)}")
-                    import traceback
-
                     traceback.print_exc()
 
-                    self.db.increment_retry(doc_id)
-
-                    current_doc = self.db.get_document(doc_id)
-                    if current_doc:
-                        if current_doc["ocr_status"] == "processing":
-                            self.db.update_ocr_status(doc_id, "pending")
-                        elif current_doc["llm_status"] == "processing":
-                            self.db.update_llm_status(doc_id, "failed")
-
-        while not self._shutdown_event.is_set():
-            try:
-                pending_docs = self.db.get_pending_documents()
-                if pending_docs:
-                    print(f"[PROCESSOR] 发现 {len(pending_docs)} 个待处理文档")
-
-                for doc in pending_docs:
-                    doc_id = doc["id"]
-                    filename = self._get_display_filename(doc)
-                    task = asyncio.create_task(process_with_semaphore(doc_id, filename))
-                    active_tasks.add(task)
-                    task.add_done_callback(active_tasks.discard)
-
-                if active_tasks:
-                    done, _ = await asyncio.wait(
-                        active_tasks, timeout=1.0 if not pending_docs else None
-                    )
-                elif not pending_docs:
-                    await asyncio.sleep(1)
+                    await asyncio.to_thread(self.db.record_failed_attempt, doc_id)
 
-            except Exception as e:
-                print(f"队列处理出错: {str(e)}")
-                import traceback
+        try:
+            while not self._shutdown_event.is_set():
+                try:
+                    self._wakeup.clear()
+                    pending_docs = await asyncio.to_thread(self.db.get_pending_documents)
+                    # 跳过仍在处理中的文档，避免重复调度
+                    new_docs = [d for d in pending_docs if d["id"] not in in_flight]
+                    if new_docs:
+                        print(f"[PROCESSOR] 发现 {len(new_docs)} 个待处理文档")
+
+                    for doc in new_docs:
+                        doc_id = doc["id"]
+                        filename = self._get_display_filename(doc)
+                        task = asyncio.create_task(process_with_semaphore(doc_id, filename))
+                        in_flight[doc_id] = task
+                        task.add_done_callback(
+                            lambda _, doc_id=doc_id: in_flight.pop(doc_id, None)
+                        )
+
+                    # 任一任务完成 (空出并发槽位) 或收到新任务通知时重新查询，
+                    # 空闲时超时后再兜底查询一次数据库
+                    waiter = asyncio.ensure_future(self._wakeup.wait())
+                    try:
+                        await asyncio.wait(
+                            [*in_flight.values(), waiter],
+                            timeout=self.idle_poll_seconds,
+                            return_when=asyncio.FIRST_COMPLETED,
+                        )
+                    finally:
+                        waiter.cancel()
 
-                traceback.print_exc()
-                await asyncio.sleep(1)
+                except Exception as e:
+                    print(f"队列处理出错: {str(e)}")
+                    traceback.print_exc()
+                    await asyncio.sleep(1)
 
-        print("[PROCESSOR] 接收到关闭信号，等待任务完成...")
-        if active_tasks:
-            await asyncio.wait(active_tasks)
-        print("[PROCESSOR] 所有任务已完成，处理器已关闭")
+            print("[PROCESSOR] 接收到关闭信号，等待任务完成...")
+            if in_flight:
+                _, still_running = await asyncio.wait(
+                    list(in_flight.values()), timeout=self.shutdown_timeout_seconds
+                )
+                if still_running:
+                    print(f"[PROCESSOR] {len(still_running)} 个任务等待超时，取消处理")
+            print("[PROCESSOR] 处理器已关闭")
+        finally:
+            # 超时或处理器本身被取消时，取消剩余任务并等待其真正结束
+            remaining = list(in_flight.values())
+            for task in remaining:
+                task.cancel()
+            if remaining:
+                await asyncio.gather(*remaining, return_exceptions=True)
 
     async def close(self):
         await self.ocr_client.close()
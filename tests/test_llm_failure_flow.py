@@ -29,8 +29,11 @@ class _FakeDB:
     def update_ocr_status(self, doc_id, status, ocr_text=None):
         self.doc["ocr_status"] = status
 
-    def increment_retry(self, doc_id):
-        return None
+    def record_failed_attempt(self, doc_id):
+        if self.doc["ocr_status"] == "processing":
+            self.doc["ocr_status"] = "pending"
+        elif self.doc["llm_status"] == "processing":
+            self.update_llm_status(doc_id, "failed")
 
 
 class _AlwaysFailExtractor:
@@ -0,0 +1,245 @@
+import sqlite3
+
+import pytest
+
+from src.models import (
+    DOCUMENT_MIGRATION_COLUMNS,
+    MAX_AUTO_RETRIES,
+    RETRY_BACKOFF_SECONDS,
+    SCHEMA_VERSION,
+    Database,
+)
+
+
+def _skip_backoff(db):
+    with db._connection() as conn:
+        conn.execute("UPDATE documents SET next_retry_at = 0")
+
+
+def test_set_travel_times_upserts_all_rows(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    location = db.add_location("Office")
+
+    db.set_travel_times(
+        [("渋谷", location["id"], 10), ("新宿", location["id"], 15)]
+    )
+    db.set_travel_times([("渋谷", location["id"], 12)])
+
+    rows = {r["station_name"]: r["duration"] for r in db.get_all_travel_times()}
+    assert rows == {"渋谷": 12, "新宿": 15}
+
+
+def test_document_travel_times_follow_listed_stations(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    office = db.add_location("Office")
+    home = db.add_location("Home")
+    db.set_travel_times(
+        [("渋谷", office["id"], 10), ("渋谷", home["id"], 20), ("新宿", office["id"], 15)]
+    )
+    doc_id = db.create_document("a.pdf", "a.pdf")
+    db.update_llm_status(
+        doc_id, "done", {"stations": [{"name": "新宿"}, {"name": "渋谷"}, {"name": ""}]}
+    )
+    db.create_document("b.pdf", "b.pdf")
+
+    expected = [("新宿", "Office"), ("渋谷", "Office"), ("渋谷", "Home")]
+    listed = {d["id"]: d["travel_times"] for d in db.get_all_documents()}
+    for travel_times in (listed[doc_id], db.get_doc_travel_times(doc_id)):
+        assert [(t["station_name"], t["location_name"]) for t in travel_times] == expected
+    assert [t for d_id, t in listed.items() if d_id != doc_id] == [[]]
+
+
+def test_delete_unfavorited_documents_keeps_favorites(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    ids = [db.create_document(f"{i}.pdf", f"{i}.pdf") for i in range(3)]
+    db.toggle_favorite(ids[1])
+
+    filenames = db.delete_unfavorited_documents()
+
+    assert sorted(filenames) == ["0.pdf", "2.pdf"]
+    assert [d["id"] for d in db.get_all_documents()] == [ids[1]]
+
+
+def test_record_failed_attempt_releases_processing_state(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    ocr_doc, llm_doc, idle_doc = [db.create_document(f"{i}.pdf") for i in range(3)]
+    db.update_ocr_status(ocr_doc, "processing")
+    db.update_llm_status(ocr_doc, "processing")
+    db.update_ocr_status(llm_doc, "done", "text")
+    db.update_llm_status(llm_doc, "processing")
+
+    for doc_id in (ocr_doc, llm_doc, idle_doc):
+        db.record_failed_attempt(doc_id)
+
+    states = {
+        doc_id: (doc["ocr_status"], doc["llm_status"], doc["retry_count"])
+        for doc_id in (ocr_doc, llm_doc, idle_doc)
+        for doc in [db.get_document(doc_id)]
+    }
+    assert states == {
+        ocr_doc: ("pending", "processing", 1),
+        llm_doc: ("done", "failed", 1),
+        idle_doc: ("pending", "pending", 1),
+    }
+
+
+def test_failed_documents_stop_auto_retrying_until_manual_retry(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    doc_id = db.create_document("a.pdf")
+    db.update_ocr_status(doc_id, "done", "text")
+
+    for _ in range(MAX_AUTO_RETRIES):
+        assert [d["id"] for d in db.get_pending_documents()] == [doc_id]
+        db.update_llm_status(doc_id, "processing")
+        db.record_failed_attempt(doc_id)
+        _skip_backoff(db)
+    assert db.get_pending_documents() == []
+
+    assert db.reset_llm_status(doc_id)
+    assert [d["id"] for d in db.get_pending_documents()] == [doc_id]
+
+
+def test_ocr_failures_stop_auto_retrying_until_manual_retry(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    doc_id = db.create_document("a.pdf")
+
+    for _ in range(MAX_AUTO_RETRIES):
+        assert [d["id"] for d in db.get_pending_documents()] == [doc_id]
+        db.update_ocr_status(doc_id, "processing")
+        db.record_failed_attempt(doc_id)
+        _skip_backoff(db)
+    assert db.get_pending_documents() == []
+    assert db.get_document(doc_id)["ocr_status"] == "failed"
+
+    assert db.reset_ocr_status(doc_id)
+    assert [d["id"] for d in db.get_pending_documents()] == [doc_id]
+
+
+def test_failed_attempts_back_off_before_retrying(tmp_path, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr("src.models.time.time", lambda: now)
+    db = Database(str(tmp_path / "test.db"))
+    doc_id = db.create_document("a.pdf")
+
+    db.update_ocr_status(doc_id, "processing")
+    db.record_failed_attempt(doc_id)
+    assert db.get_pending_documents() == []
+    now += RETRY_BACKOFF_SECONDS
+    assert [d["id"] for d in db.get_pending_documents()] == [doc_id]
+
+    # 第二次失败后等待时间翻倍
+    db.update_ocr_status(doc_id, "processing")
+    db.record_failed_attempt(doc_id)
+    now += RETRY_BACKOFF_SECONDS
+    assert db.get_pending_documents() == []
+    now += RETRY_BACKOFF_SECONDS
+    assert [d["id"] for d in db.get_pending_documents()] == [doc_id]
+
+
+def test_retry_llm_requeues_ocr_that_ran_out_of_retries(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    doc_id = db.create_document("a.pdf")
+    for _ in range(MAX_AUTO_RETRIES):
+        db.update_ocr_status(doc_id, "processing")
+        db.record_failed_attempt(doc_id)
+
+    with db._connection() as conn:
+        conn.execute("UPDATE documents SET retry_count = 0, next_retry_at = 0 WHERE id = ?", (doc_id,))
+    # OCR 失败的文档即使计数清零也不会被自动轮询选中
+    assert db.get_pending_documents() == []
+
+    assert db.reset_llm_status(doc_id)
+    assert [d["id"] for d in db.get_pending_documents()] == [doc_id]
+    assert db.get_document(doc_id)["ocr_status"] == "pending"
+
+
+def test_ocr_success_resets_retry_count(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    doc_id = db.create_document("a.pdf")
+    for _ in range(MAX_AUTO_RETRIES - 1):
+        db.update_ocr_status(doc_id, "processing")
+        db.record_failed_attempt(doc_id)
+
+    db.update_ocr_status(doc_id, "done", "text")
+    db.update_llm_status(doc_id, "processing")
+    db.record_failed_attempt(doc_id)
+    _skip_backoff(db)
+
+    assert [d["id"] for d in db.get_pending_documents()] == [doc_id]
+
+
+def test_init_db_migrates_legacy_schema_once(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE documents (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "filename TEXT NOT NULL, upload_time TEXT NOT NULL, ocr_status TEXT, "
+        "ocr_text TEXT, llm_status TEXT, properties TEXT, retry_count INTEGER)"
+    )
+    conn.commit()
+    conn.close()
+
+    Database(str(db_path)).close()
+    db = Database(str(db_path))
+
+    with db._connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(documents)")}
+    assert {column for column, _ in DOCUMENT_MIGRATION_COLUMNS} <= columns
+
+
+def test_init_db_gives_unfinished_legacy_documents_a_fresh_retry_budget(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE documents (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "filename TEXT NOT NULL, upload_time TEXT NOT NULL, ocr_status TEXT, "
+        "ocr_text TEXT, llm_status TEXT, properties TEXT, retry_count INTEGER)"
+    )
+    conn.executemany(
+        "INSERT INTO documents (filename, upload_time, ocr_status, llm_status, retry_count) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [
+            ("a.pdf", "2024-01-01T00:00:00", "pending", "pending", 7),
+            ("b.pdf", "2024-01-02T00:00:00", "done", "failed", 5),
+            ("c.pdf", "2024-01-03T00:00:00", "done", "done", 2),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    db = Database(str(db_path))
+
+    assert [d["filename"] for d in db.get_pending_documents()] == ["b.pdf", "a.pdf"]
+    assert db.get_document(3)["retry_count"] == 2
+
+
+def test_close_closes_borrowed_connections_and_rejects_new_ones(tmp_path):
+    db = Database(str(tmp_path / "test.db"), pool_size=1)
+    with db._connection() as conn:
+        db.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.get_pending_documents()
+
+
+def test_update_llm_status_stores_integers_beyond_64_bits(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    doc_id = db.create_document("a.pdf")
+
+    db.update_llm_status(doc_id, "done", {"rent": 2**70, "name": "渋谷"})
+
+    assert db.get_document(doc_id)["properties"]["name"] == "渋谷"
+
+
+def test_legacy_file_hash_lookup_tracks_remaining_md5_hashes(tmp_path):
+    db = Database(str(tmp_path / "test.db"))
+    legacy = db.create_document("a.pdf", None, "0" * 32)
+    db.create_document("b.pdf", None, "1" * 40)
+
+    assert db.has_legacy_file_hashes()
+    assert db.get_legacy_hash_documents() == [{"id": legacy, "filename": "a.pdf"}]
+
+    db.update_file_hash(legacy, "2" * 40)
+    assert not db.has_legacy_file_hashes()
@@ -0,0 +1,56 @@
+import asyncio
+import base64
+import io
+
+import fitz
+from PIL import Image
+
+from src.ocr import OCRClient
+
+
+def test_extract_pages_runs_concurrently_and_keeps_page_order():
+    client = OCRClient("http://localhost:8000/v1", "test-model")
+    client.max_concurrent_pages = 2
+    active = 0
+    peak = 0
+
+    async def _fake_extract(img_base64):
+        nonlocal active, peak
+        index = int(img_base64)
+        active += 1
+        peak = max(peak, active)
+        # 让靠前的页面更晚完成，验证结果仍按页码排序
+        await asyncio.sleep(0.01 * (5 - index))
+        active -= 1
+        return f"page {index + 1}"
+
+    client._extract_from_base64 = _fake_extract
+
+    async def _pages():
+        for index in range(5):
+            yield str(index)
+
+    texts = asyncio.run(client._extract_pages(_pages()))
+
+    assert texts == [f"page {i + 1}" for i in range(5)]
+    assert peak == 2
+
+
+def test_iter_pdf_pages_renders_every_page(tmp_path):
+    pdf_path = tmp_path / "plan.pdf"
+    with fitz.open() as doc:
+        for _ in range(3):
+            doc.new_page(width=595, height=842)
+        doc.save(pdf_path)
+    client = OCRClient("http://localhost:8000/v1", "test-model")
+
+    async def _collect():
+        return [page async for page in client._iter_pdf_pages(str(pdf_path))]
+
+    pages = asyncio.run(_collect())
+
+    assert len(pages) == 3
+    for page in pages:
+        with Image.open(io.BytesIO(base64.b64decode(page))) as image:
+            assert image.format == "PNG"
+            assert max(image.size) <= client.max_image_size
@@ -0,0 +1,22 @@
+import io
+
+from PIL import Image
+
+from src.previews import (
+    PREVIEW_MAX_SIZE,
+    THUMBNAIL_WIDTH,
+    render_preview,
+    render_thumbnail,
+    render_to_bytes,
+)
+
+
+def test_render_to_bytes_returns_bounded_jpeg(tmp_path):
+    source = tmp_path / "floorplan.png"
+    Image.new("RGB", (3000, 1500), "white").save(source)
+
+    with Image.open(io.BytesIO(render_to_bytes(render_thumbnail, source))) as thumb:
+        assert thumb.format == "JPEG"
+        assert thumb.width == THUMBNAIL_WIDTH
+    with Image.open(io.BytesIO(render_to_bytes(render_preview, source))) as preview:
+        assert max(preview.size) <= PREVIEW_MAX_SIZE
@@ -0,0 +1,114 @@
+import asyncio
+from typing import cast
+
+from src.models import Database
+from src.processor import DocumentProcessor
+
+
+class _QueueDB:
+    def __init__(self):
+        self.pending = []
+
+    def get_pending_documents(self):
+        pending, self.pending = self.pending, []
+        return pending
+
+
+def _make_processor(db) -> DocumentProcessor:
+    processor = DocumentProcessor.__new__(DocumentProcessor)
+    processor.config = {"app": {"parallel_docs": 2}}
+    processor.db = cast(Database, db)
+    processor._shutdown_event = asyncio.Event()
+    processor._wakeup = asyncio.Event()
+    processor.idle_poll_seconds = 30
+    processor.shutdown_timeout_seconds = 10
+    return processor
+
+
+def test_notify_wakes_idle_queue_without_polling():
+    async def scenario():
+        db = _QueueDB()
+        processor = _make_processor(db)
+        processed = []
+
+        async def fake_process_document(doc_id):
+            processed.append(doc_id)
+
+        processor.process_document = fake_process_document
+        loop_task = asyncio.create_task(processor.process_queue())
+        await asyncio.sleep(0.05)
+
+        db.pending = [{"id": 7, "filename": "a.pdf"}]
+        processor.notify()
+        await asyncio.sleep(0.1)
+        assert processed == [7]
+
+        processor._shutdown_event.set()
+        processor.notify()
+        await asyncio.wait_for(loop_task, timeout=1)
+
+    asyncio.run(scenario())
+
+
+def test_queue_refills_slots_without_rescheduling_in_flight_docs():
+    async def scenario():
+        db = _QueueDB()
+        processor = _make_processor(db)
+        started = []
+        release = {1: asyncio.Event(), 2: asyncio.Event(), 3: asyncio.Event()}
+
+        async def fake_process_document(doc_id):
+            started.append(doc_id)
+            await release[doc_id].wait()
+
+        processor.process_document = fake_process_document
+        db.get_pending_documents = lambda: [
+            {"id": i, "filename": f"{i}.pdf"}
+            for i in (1, 2, 3)
+            if not release[i].is_set()
+        ]
+        loop_task = asyncio.create_task(processor.process_queue())
+        await asyncio.sleep(0.05)
+        assert started == [1, 2]
+
+        release[1].set()
+        await asyncio.sleep(0.05)
+        assert started == [1, 2, 3]
+
+        processor._shutdown_event.set()
+        release[2].set()
+        release[3].set()
+        await asyncio.wait_for(loop_task, timeout=1)
+
+    asyncio.run(scenario())
+
+
+def test_shutdown_cancels_stuck_docs_and_skips_queued_ones():
+    async def scenario():
+        db = _QueueDB()
+        processor = _make_processor(db)
+        processor.shutdown_timeout_seconds = 0.05
+        started = []
+        cancelled = []
+
+        async def fake_process_document(doc_id):
+            started.append(doc_id)
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(doc_id)
+                raise
+
+        processor.process_document = fake_process_document
+        db.pending = [{"id": i, "filename": f"{i}.pdf"} for i in (1, 2, 3)]
+        loop_task = asyncio.create_task(processor.process_queue())
+        await asyncio.sleep(0.05)
+        assert started == [1, 2]
+
+        processor._shutdown_event.set()
+        processor.notify()
+        await asyncio.wait_for(loop_task, timeout=1)
+        assert sorted(cancelled) == [1, 2]
+        assert started == [1, 2]
+
+    asyncio.run(scenario())